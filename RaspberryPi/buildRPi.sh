@@ -1,8 +1,8 @@
 #!/bin/bash
 
-# Build the RPi version of lwaTV3.py
+# Build the RPi version of lwaTV3.py - the video sink and decoder are picked
+# at runtime so this is just a copy
 cp ../lwaTV3.py lwaTV3.rpi.py
-patch lwaTV3.rpi.py <convert3toRPi.patch
 perms=`stat -c '%a' ../lwaTV3.py 2>/dev/null`
 if [[ "$?" != "0" ]]; then
     perms=`stat -f '%p' ../lwaTV3.py 2>/dev/null`
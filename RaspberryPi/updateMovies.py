@@ -6,16 +6,25 @@ script.
 """
 
 import os
+import re
 import sys
 import glob
+import json
 import math
+import mmap
 import time
+import socket
+import shutil
+import fcntl
+import hashlib
 import argparse
-from urllib.request import urlopen
+import threading
+from urllib.request import urlopen, Request
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 
 # Number of days worth of movies to keep on hand for replaying
-_DAYS_TO_STORE = 7
+_DAYS_TO_STORE = 5
 
 
 # Paths
@@ -24,10 +33,713 @@ _IMAGE_PATH = os.path.join(_BASE_PATH, 'images')
 _MOVIE_PATH = os.path.join(_BASE_PATH, 'movies')
 
 
+# How many times each movie has been played, as recorded by lwaTV3.py
+_PLAY_COUNTS = os.path.join(_MOVIE_PATH, 'playcounts.json')
+
+
 # Download chunk size
 _CHUNK_SIZE = 1024**2
 
 
+# Age in seconds after which a partial download is considered abandoned
+_STALE_AGE = 3600
+
+
+# Peer sharing - TCP port for the HTTP server, UDP port for discovery, and
+# the discovery messages
+_PEER_PORT = 8642
+_DISCOVERY_QUERY = b'LWATV-MOVIES?'
+_DISCOVERY_REPLY = b'LWATV-MOVIES'
+
+
+# Cache of movie checksums for the peer manifest
+_MANIFEST_CACHE = os.path.join(_MOVIE_PATH, 'manifest.json')
+
+
+# Bandwidth ledger shared with lwaTV3.py
+_BANDWIDTH_FILE = os.path.join(_MOVIE_PATH, 'bandwidth.json')
+
+
+# Default daily download quota in MB for the ledger, 0 for no quota, and the
+# help text for it; lwaTV3.py uses these too so that the two agree
+DEFAULT_QUOTA_MB = 0
+QUOTA_HELP = 'daily download quota in MB for metered links, shared between lwaTV3.py and updateMovies.py; 0 for no quota'
+
+
+# Width of the poster frames shown by lwaTV3.py while a movie is starting
+_POSTER_WIDTH = 480
+
+
+# GStreamer is only loaded when posters need to be made, see init_gstreamer()
+Gst = None
+
+
+def init_gstreamer():
+    """
+    Import and initialize GStreamer 1.0, if that has not already been done.
+    Returns True if GStreamer is available.
+    """
+    
+    global Gst
+    if Gst is not None:
+        return True
+        
+    try:
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst as _Gst
+    except (ImportError, ValueError):
+        return False
+    _Gst.init(None)
+    Gst = _Gst
+    return True
+
+
+def load_play_counts():
+    """
+    Load the per-movie play counts recorded by lwaTV3.py.
+    """
+    
+    try:
+        with open(_PLAY_COUNTS, 'r') as fh:
+            return json.load(fh)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def get_free_space():
+    """
+    Return the free space in bytes on the file system holding the movies.
+    """
+    
+    return shutil.disk_usage(_MOVIE_PATH).free
+
+
+def fits_in_budget(size, args):
+    """
+    Return whether or not 'size' more bytes of movies fit within the storage
+    budget set by --max-mb and --min-free-mb.  Downloads in progress count
+    against the budget.
+    """
+    
+    if args.max_mb is not None:
+        movies = glob.glob(os.path.join(_MOVIE_PATH, '*.mov')) + glob.glob(os.path.join(_MOVIE_PATH, '*.mov.part'))
+        used = sum([os.path.getsize(movie) for movie in movies])
+        if used + size > args.max_mb*1024**2:
+            return False
+    if args.min_free_mb is not None:
+        if get_free_space() - size < args.min_free_mb*1024**2:
+            return False
+    return True
+
+
+def make_room(size, movie, args):
+    """
+    Evict older movies, starting with the most played ones, until 'size' bytes
+    for 'movie' fit within the storage budget.  Returns True if there is room.
+    """
+    
+    if fits_in_budget(size, args):
+        return True
+        
+    # Only movies older than the one we want are up for eviction
+    counts = load_play_counts()
+    candidates = []
+    for other in glob.glob(os.path.join(_MOVIE_PATH, '*.mov')):
+        otherBase = os.path.basename(other)
+        if otherBase < movie:
+            candidates.append((-counts.get(otherBase, 0), otherBase, other))
+    candidates.sort()
+    
+    # Make sure that we can get there before deleting anything
+    freed = sum([os.path.getsize(other) for _,_,other in candidates])
+    if not fits_in_budget(size - freed, args):
+        return False
+        
+    for plays,otherBase,other in candidates:
+        if args.verbose:
+            print("Evicting %s (played %i times) to make room for %s" % (otherBase, -plays, movie))
+        try:
+            os.unlink(other)
+        except Exception as e:
+            print("Error deleting %s: %s" % (otherBase, str(e)))
+        if fits_in_budget(size, args):
+            break
+    return fits_in_budget(size, args)
+
+
+def _day_key(t):
+    return time.strftime('%Y-%m-%d', time.localtime(t))
+
+
+def _hour_key(t):
+    return time.strftime('%Y-%m-%dT%H', time.localtime(t))
+
+
+def seconds_until_tomorrow(t=None):
+    """
+    Return the number of seconds until local midnight.
+    """
+    
+    if t is None:
+        t = time.time()
+    lt = time.localtime(t)
+    midnight = time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday+1, 0, 0, 0, 0, 0, -1))
+    return max([1.0, midnight - t])
+
+
+class BandwidthLedger(object):
+    """
+    Class to keep track of the number of bytes downloaded per hour and per day
+    (local time) in a JSON file that is shared by lwaTV3.py and updateMovies.py.
+    Downloads are split into 'images', 'movies', and 'peers' and only the
+    first two count against a quota since peer transfers stay on the LAN.
+    Counts are kept in memory until flush() merges them into the file under an
+    exclusive lock.
+    """
+    
+    METERED = ('images', 'movies')
+    
+    def __init__(self, filename=_BANDWIDTH_FILE, keepHours=48, keepDays=31):
+        self.filename = filename
+        self.keepHours = keepHours
+        self.keepDays = keepDays
+        
+        self.pending = {'hours': {}, 'days': {}}
+        self.lastFlush = time.time()
+        
+    def record(self, category, nBytes, t=None):
+        """
+        Record that 'nBytes' were downloaded for 'category'.
+        """
+        
+        if t is None:
+            t = time.time()
+        for period,key in (('hours', _hour_key(t)), ('days', _day_key(t))):
+            entry = self.pending[period].setdefault(key, {})
+            entry[category] = entry.get(category, 0) + nBytes
+            
+    def _read(self):
+        try:
+            with open(self.filename, 'r') as fh:
+                ledger = json.load(fh)
+        except (IOError, OSError, ValueError):
+            ledger = {}
+        ledger.setdefault('hours', {})
+        ledger.setdefault('days', {})
+        return ledger
+        
+    def _merge(self, ledger):
+        for period in ('hours', 'days'):
+            for key,counts in self.pending[period].items():
+                entry = ledger[period].setdefault(key, {})
+                for category,nBytes in counts.items():
+                    entry[category] = entry.get(category, 0) + nBytes
+        return ledger
+        
+    def flush(self):
+        """
+        Merge the pending counts into the ledger file.
+        """
+        
+        self.lastFlush = time.time()
+        if len(self.pending['hours']) == 0:
+            return
+            
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(self.filename+'.lock', 'a') as lh:
+                fcntl.flock(lh, fcntl.LOCK_EX)
+                ledger = self._merge(self._read())
+                
+                # Prune old entries
+                for period,keep in (('hours', self.keepHours), ('days', self.keepDays)):
+                    for key in sorted(ledger[period].keys())[:-keep]:
+                        del ledger[period][key]
+                        
+                with open(self.filename+'.tmp', 'w') as fh:
+                    json.dump(ledger, fh)
+                os.replace(self.filename+'.tmp', self.filename)
+        except (IOError, OSError) as e:
+            print("Error updating the bandwidth ledger: %s" % str(e))
+            return
+        self.pending = {'hours': {}, 'days': {}}
+        
+    def load(self):
+        """
+        Return the contents of the ledger file plus any pending counts.
+        """
+        
+        return self._merge(self._read())
+        
+    def get_day(self, t=None):
+        """
+        Return a dictionary of the bytes downloaded per category on the day
+        containing 't', plus the 'metered' total.
+        """
+        
+        if t is None:
+            t = time.time()
+        day = dict(self.load()['days'].get(_day_key(t), {}))
+        day['metered'] = sum([day.get(category, 0) for category in self.METERED])
+        return day
+        
+    def project(self, t=None, window=3):
+        """
+        Return the projected metered total for the day containing 't' by
+        extrapolating the image polls over the last 'window' hours to the end of
+        the day.  Movies are assumed to be done for the day.
+        """
+        
+        if t is None:
+            t = time.time()
+        hours = self.load()['hours']
+        
+        recent, tStart = 0, t
+        for i in range(window):
+            tHour = t - i*3600
+            counts = hours.get(_hour_key(tHour), None)
+            if counts is not None:
+                recent += counts.get('images', 0)
+                lt = time.localtime(tHour)
+                tStart = time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, lt.tm_hour, 0, 0, 0, 0, -1))
+        rate = recent/max([60.0, t - tStart])
+        return self.get_day(t)['metered'] + rate*seconds_until_tomorrow(t)
+        
+    def get_poll_interval(self, quota, bytesPerPoll, t=None):
+        """
+        Return the shortest interval in seconds between image polls that keeps
+        the rest of the day's polls within a daily quota of 'quota' bytes.
+        """
+        
+        if t is None:
+            t = time.time()
+        remaining = quota - self.get_day(t)['metered']
+        left = seconds_until_tomorrow(t)
+        if remaining <= 0:
+            return left
+        return bytesPerPoll*left/remaining
+
+
+def in_off_peak(window, t=None):
+    """
+    Return whether or not the local time is within an off-peak window given as
+    'start-end' in hours, e.g., '0-6' or '22-5'.
+    """
+    
+    if t is None:
+        t = time.time()
+    start, end = [int(v) for v in window.split('-', 1)]
+    hour = time.localtime(t).tm_hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def _fill(dh, buffer):
+    """
+    Read from the open URL 'dh' into the memoryview 'buffer' until it is full
+    or there is no more data.  Returns the number of bytes read.
+    """
+    
+    nRead = 0
+    while nRead < len(buffer):
+        n = dh.readinto(buffer[nRead:])
+        if not n:
+            break
+        nRead += n
+    return nRead
+
+
+def download(dh, filename, sha256=None, size=0, chunkSize=_CHUNK_SIZE, preallocate=False, directIO=False, record=False):
+    """
+    Save the contents of the open URL 'dh' to 'filename', going through a
+    temporary '.part' file so that nobody sees a partial movie.  If 'sha256'
+    is given the download is hashed and checked against it.  If 'size' is
+    given the download must be exactly that long.  If 'record' is True the
+    checksum is computed as the data arrive and saved to the manifest cache
+    once the movie is in place.  Returns the number of bytes downloaded.
+    
+    The data are read into a single buffer of 'chunkSize' bytes that is reused
+    for every chunk.  If 'preallocate' is True and the size is known the file
+    is allocated up front to limit fragmentation.  If 'directIO' is True the
+    file is written with O_DIRECT to keep the movie out of the page cache.
+    """
+    
+    partname = filename+'.part'
+    digest = None
+    if sha256 is not None or record:
+        digest = hashlib.sha256()
+    nBytes = 0
+    
+    # O_DIRECT needs an aligned buffer and whole blocks, which an anonymous
+    # mmap of a whole number of pages provides
+    flags = os.O_WRONLY|os.O_CREAT|os.O_TRUNC
+    if directIO and hasattr(os, 'O_DIRECT'):
+        chunkSize = max(mmap.PAGESIZE, chunkSize // mmap.PAGESIZE * mmap.PAGESIZE)
+        buffer = mmap.mmap(-1, chunkSize)
+        flags |= os.O_DIRECT
+    else:
+        directIO = False
+        buffer = bytearray(chunkSize)
+    view = memoryview(buffer)
+    
+    try:
+        try:
+            fd = os.open(partname, flags, 0o644)
+        except OSError:
+            # Not all filesystems support O_DIRECT
+            if not directIO:
+                raise
+            directIO = False
+            fd = os.open(partname, flags & ~os.O_DIRECT, 0o644)
+    except OSError:
+        dh.close()
+        raise
+        
+    try:
+        if preallocate and size > 0 and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                pass
+                
+        while True:
+            n = _fill(dh, view)
+            if n == 0:
+                break
+            if digest is not None:
+                digest.update(view[:n])
+            
+            if directIO and n % mmap.PAGESIZE != 0:
+                # The last, partial block has to go through the page cache
+                fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_DIRECT)
+                directIO = False
+            nWritten = 0
+            while nWritten < n:
+                nWritten += os.write(fd, view[nWritten:n])
+            nBytes += n
+            
+        # Trim any unused preallocation
+        os.ftruncate(fd, nBytes)
+    except BaseException:
+        # Do not leave a partial, and possibly preallocated, file behind
+        os.unlink(partname)
+        raise
+    finally:
+        os.close(fd)
+        view.release()
+        dh.close()
+        
+    if size > 0 and nBytes != size:
+        os.unlink(partname)
+        raise ValueError("size mismatch, got %i of %i bytes" % (nBytes, size))
+    if sha256 is not None and digest.hexdigest() != sha256:
+        os.unlink(partname)
+        raise ValueError("checksum mismatch")
+    os.rename(partname, filename)
+    
+    if record:
+        record_checksum(filename, digest.hexdigest())
+    return nBytes
+
+
+def _load_manifest_cache():
+    try:
+        with open(_MANIFEST_CACHE, 'r') as fh:
+            return json.load(fh)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _save_manifest_cache(cache):
+    try:
+        with open(_MANIFEST_CACHE+'.tmp', 'w') as fh:
+            json.dump(cache, fh)
+        os.replace(_MANIFEST_CACHE+'.tmp', _MANIFEST_CACHE)
+    except (IOError, OSError):
+        pass
+
+
+def record_checksum(filename, sha256):
+    """
+    Add the SHA-256 checksum of a movie that has just been saved to the
+    manifest cache.
+    """
+    
+    cache = _load_manifest_cache()
+    st = os.stat(filename)
+    cache[os.path.basename(filename)] = {'size': st.st_size, 'mtime': st.st_mtime, 'sha256': sha256}
+    _save_manifest_cache(cache)
+
+
+def build_manifest(update=True):
+    """
+    Return a dictionary of the size and SHA-256 checksum of each movie in the
+    cache.  Checksums are cached on disk, mostly by download() as the movies
+    arrive.  If 'update' is True any movie without an up to date checksum is
+    hashed and the cache is saved, otherwise those movies are left out.
+    """
+    
+    cache = _load_manifest_cache()
+    
+    manifest = {}
+    for movie in glob.glob(os.path.join(_MOVIE_PATH, '*.mov')):
+        movieBase = os.path.basename(movie)
+        try:
+            st = os.stat(movie)
+        except OSError:
+            # Deleted out from under us
+            continue
+        entry = cache.get(movieBase, None)
+        if entry is None or entry['size'] != st.st_size or entry['mtime'] != st.st_mtime:
+            if not update:
+                continue
+            digest = hashlib.sha256()
+            with open(movie, 'rb') as fh:
+                while True:
+                    data = fh.read(_CHUNK_SIZE)
+                    if len(data) == 0:
+                        break
+                    digest.update(data)
+            entry = {'size': st.st_size, 'mtime': st.st_mtime, 'sha256': digest.hexdigest()}
+        manifest[movieBase] = entry
+        
+    if update:
+        _save_manifest_cache(manifest)
+    return manifest
+
+
+class MovieHandler(SimpleHTTPRequestHandler):
+    """
+    HTTP request handler that serves the movie manifest and the movies, and
+    nothing else, to other kiosks.  Only movies whose checksums are already
+    cached are listed so that a request never waits on hashing.
+    """
+    
+    verbose = False
+    
+    def __init__(self, *args, **kwds):
+        super(MovieHandler, self).__init__(*args, directory=_MOVIE_PATH, **kwds)
+        
+    def _is_allowed(self):
+        return re.match(r'^/\d+\.mov$', self.path) is not None
+        
+    def do_GET(self):
+        if self.path == '/manifest.json':
+            data = json.dumps(build_manifest(update=False)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self._is_allowed():
+            super(MovieHandler, self).do_GET()
+        else:
+            self.send_error(404)
+            
+    def do_HEAD(self):
+        if self._is_allowed():
+            super(MovieHandler, self).do_HEAD()
+        else:
+            self.send_error(404)
+            
+    def log_message(self, format, *args):
+        if self.verbose:
+            super(MovieHandler, self).log_message(format, *args)
+
+
+def answer_discovery(port, verbose=False):
+    """
+    Answer peer discovery broadcasts with the port that movies are served on.
+    """
+    
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', _PEER_PORT))
+    while True:
+        data, addr = sock.recvfrom(1024)
+        if data.strip() == _DISCOVERY_QUERY:
+            if verbose:
+                print("Answering discovery request from %s" % addr[0])
+            sock.sendto(b'%s %i' % (_DISCOVERY_REPLY, port), addr)
+
+
+def serve(args):
+    """
+    Serve the movie cache to other kiosks on the LAN until interrupted.
+    """
+    
+    MovieHandler.verbose = args.verbose
+    server = ThreadingHTTPServer(('', args.port), MovieHandler)
+    
+    responder = threading.Thread(target=answer_discovery, args=(args.port, args.verbose))
+    responder.daemon = True
+    responder.start()
+    
+    # Fill in any checksums that are missing from the cache
+    hasher = threading.Thread(target=build_manifest)
+    hasher.daemon = True
+    hasher.start()
+    
+    print("Serving %s on port %i" % (_MOVIE_PATH, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def discover_peers(timeout=1.0):
+    """
+    Broadcast a discovery request on the LAN and return a list of the
+    'host:port' of any kiosks that answer.
+    """
+    
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.settimeout(timeout)
+    sock.sendto(_DISCOVERY_QUERY, ('<broadcast>', _PEER_PORT))
+    
+    peers = []
+    tStop = time.time() + timeout
+    while time.time() < tStop:
+        try:
+            data, addr = sock.recvfrom(1024)
+        except socket.timeout:
+            break
+        fields = data.split()
+        if len(fields) == 2 and fields[0] == _DISCOVERY_REPLY:
+            peer = '%s:%i' % (addr[0], int(fields[1]))
+            if peer not in peers:
+                peers.append(peer)
+    sock.close()
+    return peers
+
+
+def get_upstream_size(url):
+    """
+    Return the size of a movie on lwalab or None if that cannot be found.
+    """
+    
+    try:
+        dh = urlopen(Request(url, method='HEAD'), timeout=10)
+        dh.close()
+        return int(dh.headers.get('Content-Length'))
+    except Exception:
+        return None
+
+
+def fetch_from_peers(movie, manifests, url, args):
+    """
+    Try to download a movie from one of the peers.  Returns the number of
+    bytes downloaded, which is zero if no peer had a good copy, or None if the
+    movie does not fit within the storage budget.
+    """
+    
+    upstreamSize = -1
+    for peer,manifest in manifests.items():
+        entry = manifest.get(movie, None)
+        if entry is None:
+            continue
+            
+        # Check the size against lwalab, if we can reach it.  lwalab does
+        # not publish checksums so the peer's checksum has to do.
+        if upstreamSize == -1:
+            upstreamSize = get_upstream_size(url)
+        if upstreamSize is not None and upstreamSize != entry['size']:
+            print("Peer %s has an incomplete copy of %s" % (peer, movie))
+            continue
+            
+        if not make_room(entry['size'], movie, args):
+            return None
+            
+        if args.verbose:
+            print("Downloading '%s' from peer %s..." % (movie, peer))
+        try:
+            dh = urlopen('http://%s/%s' % (peer, movie), timeout=30)
+            return download(dh, os.path.join(_MOVIE_PATH, movie), sha256=entry['sha256'],
+                            size=entry['size'], chunkSize=int(args.chunk_kb*1024),
+                            preallocate=args.preallocate, directIO=args.direct_io, record=True)
+        except Exception as e:
+            print("Error with %s from peer %s: %s" % (movie, peer, str(e)))
+    return 0
+
+
+def get_poster(movie):
+    """
+    Return the filename of the poster frame for a movie.
+    """
+    
+    return os.path.splitext(movie)[0]+'.jpg'
+
+
+def make_poster(movie, width=_POSTER_WIDTH, position=0.1, timeout=30):
+    """
+    Save a scaled JPEG poster frame taken 'position' of the way into a movie
+    next to it.  Returns True if the poster was made.
+    """
+    
+    if not init_gstreamer():
+        return False
+        
+    pipeline = Gst.parse_launch(' '.join(['uridecodebin uri="%s" caps=video/x-raw expose-all-streams=false' % Gst.filename_to_uri(movie),
+                                          '! videoconvert ! videoscale',
+                                          '! video/x-raw,width=%i,pixel-aspect-ratio=1/1' % width,
+                                          '! jpegenc quality=85 ! appsink name=sink']))
+    sink = pipeline.get_by_name('sink')
+    try:
+        # Preroll, seek to a representative frame, and grab it
+        pipeline.set_state(Gst.State.PAUSED)
+        if pipeline.get_state(timeout*Gst.SECOND)[0] != Gst.StateChangeReturn.SUCCESS:
+            return False
+        ok, duration = pipeline.query_duration(Gst.Format.TIME)
+        if ok and duration > 0:
+            pipeline.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH|Gst.SeekFlags.KEY_UNIT, int(duration*position))
+            pipeline.get_state(timeout*Gst.SECOND)
+        sample = sink.emit('pull-preroll')
+        if sample is None:
+            return False
+        buffer = sample.get_buffer()
+        data = buffer.extract_dup(0, buffer.get_size())
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+        
+    poster = get_poster(movie)
+    with open(poster+'.tmp', 'wb') as fh:
+        fh.write(data)
+    os.replace(poster+'.tmp', poster)
+    return True
+
+
+def update_posters(args):
+    """
+    Make poster frames for any movies that do not have an up-to-date one and
+    remove the posters of movies that are gone.
+    """
+    
+    if not init_gstreamer():
+        print("GStreamer is not available, skipping poster frames")
+        return
+        
+    for movie in sorted(glob.glob(os.path.join(_MOVIE_PATH, '*.mov'))):
+        poster = get_poster(movie)
+        if os.path.exists(poster) and os.path.getmtime(poster) >= os.path.getmtime(movie):
+            continue
+        if args.verbose:
+            print("Making a poster frame for %s" % os.path.basename(movie))
+        try:
+            if not make_poster(movie):
+                print("Could not make a poster frame for %s" % os.path.basename(movie))
+        except Exception as e:
+            print("Error making a poster frame for %s: %s" % (os.path.basename(movie), str(e)))
+            
+    for poster in glob.glob(os.path.join(_MOVIE_PATH, '*.jpg')):
+        movie = os.path.splitext(poster)[0]+'.mov'
+        if re.match(r'^\d+\.jpg$', os.path.basename(poster)) and not os.path.exists(movie):
+            os.unlink(poster)
+
+
 def main(args):
     # Make sure there is a movie directory
     if not os.path.exists(_MOVIE_PATH):
@@ -53,13 +765,33 @@ def main(args):
             
             sizes.append( os.path.getsize(movie) )
             
+        counts = load_play_counts()
         print("%i movies occupy %.1f MB of disk space" % (len(currentMovies), sum(sizes)/1024.0**2))
         for movie,size,age in zip(movies, sizes, ages):
+            plays = counts.get(movie, 0)
             if age == 1:
-                print("  %s @ %.1f MB -> %i day old" % (movie, size/1024.0**2, age))
+                print("  %s @ %.1f MB -> %i day old, played %i times" % (movie, size/1024.0**2, age, plays))
             else:
-                print("  %s @ %.1f MB -> %i days old" % (movie, size/1024.0**2, age))
+                print("  %s @ %.1f MB -> %i days old, played %i times" % (movie, size/1024.0**2, age, plays))
                 
+        # Report on the storage budget
+        free = get_free_space()
+        print("%.1f MB free on the movie file system" % (free/1024.0**2,))
+        if args.max_mb is not None:
+            print("Using %.1f%% of the %.1f MB movie budget" % (100.0*sum(sizes)/(args.max_mb*1024**2), args.max_mb))
+        if args.min_free_mb is not None:
+            print("%.1f MB available above the %.1f MB free space floor" % ((free - args.min_free_mb*1024**2)/1024.0**2, args.min_free_mb))
+            
+        # Report on bandwidth
+        ledger = BandwidthLedger()
+        today = ledger.get_day()
+        print("%.1f MB downloaded today: %.1f MB of images, %.1f MB of movies, and %.1f MB from peers" % (today['metered']/1024.0**2, today.get('images', 0)/1024.0**2, today.get('movies', 0)/1024.0**2, today.get('peers', 0)/1024.0**2))
+        projected = ledger.project()
+        if args.quota_mb > 0:
+            print("Projected to use %.1f MB of the %.1f MB daily quota" % (projected/1024.0**2, args.quota_mb))
+        else:
+            print("Projected to use %.1f MB today" % (projected/1024.0**2,))
+            
     else:
         # Get the current MJD in order to figure out what can be downloaded
         tNow = time.time()
@@ -93,31 +825,112 @@ def main(args):
             except Exception as e:
                 print("Error deleting %s: %s" % (os.path.basename(movie), str(e)))
                 
-        # ... in with the new
+        # Clean up after downloads that did not finish, leaving alone any that
+        # another copy of this script might be working on
+        for part in glob.glob(os.path.join(_MOVIE_PATH, '*.mov.part')):
+            try:
+                if time.time() - os.path.getmtime(part) > _STALE_AGE:
+                    if args.verbose:
+                        print("Removing stale partial download %s" % os.path.basename(part))
+                    os.unlink(part)
+            except Exception as e:
+                print("Error deleting %s: %s" % (os.path.basename(part), str(e)))
+                
+        # On a metered link only download movies from lwalab during off-peak
+        # hours; peers do not count against the quota
+        ledger = BandwidthLedger()
+        deferUpstream = args.quota_mb > 0 and not in_off_peak(args.off_peak)
+        
+        # Find out what the other kiosks have
+        peers = list(args.peer or [])
+        if args.discover and len(toDownload) > 0:
+            peers.extend(discover_peers())
+        manifests = {}
+        for peer in peers:
+            if ':' not in peer:
+                peer = '%s:%i' % (peer, _PEER_PORT)
+            try:
+                dh = urlopen('http://%s/manifest.json' % peer, timeout=10)
+                manifests[peer] = json.loads(dh.read())
+                dh.close()
+            except Exception as e:
+                print("Error getting the manifest from peer %s: %s" % (peer, str(e)))
+        if args.verbose and len(peers) > 0:
+            print("Found %i usable peer(s) out of %i" % (len(manifests), len(peers)))
+            
+        # ... in with the new, starting with the most recent so that those are
+        # the ones that are kept if we run out of space
         if args.verbose:
             print("%i movie(s) will be downloaded" % len(toDownload))
+        toDownload.sort(reverse=True)
+        peerBytes = upstreamBytes = 0
+        deferred = 0
         for movie in toDownload:
             if args.lwatv2:
                 url = 'https://lwalab.phys.unm.edu/lwatv2/%s' % movie
             else:
                 url = 'https://lwalab.phys.unm.edu/lwatv/%s' % movie
+                
+            # Try the peers first...
+            if len(manifests) > 0:
+                nBytes = fetch_from_peers(movie, manifests, url, args)
+                if nBytes is None:
+                    print("Skipping %s: it does not fit within the storage budget" % movie)
+                    continue
+                elif nBytes > 0:
+                    peerBytes += nBytes
+                    ledger.record('peers', nBytes)
+                    ledger.flush()
+                    continue
+                    
+            # ... and then lwalab
+            if deferUpstream:
+                deferred += 1
+                continue
             if args.verbose:
                 print("Downloading '%s'..." % url)
-                
             try:
                 dh = urlopen(url)
-                fh = open(os.path.join(_MOVIE_PATH, movie), 'wb')
-                while True:
-                    data = dh.read(_CHUNK_SIZE)
-                    if len(data) == 0:
-                        break
-                    fh.write(data)
-                dh.close()
-                fh.close()
+                
+                # Make sure that it will fit
+                size = int(dh.headers.get('Content-Length', 0))
+                if not make_room(size, movie, args):
+                    print("Skipping %s: %.1f MB does not fit within the storage budget" % (movie, size/1024.0**2))
+                    dh.close()
+                    continue
+                    
+                # ... and within the quota, leaving room for the image polls
+                if args.quota_mb > 0 and ledger.project() + size > args.quota_mb*1024**2:
+                    print("Skipping %s: %.1f MB does not fit within the daily quota" % (movie, size/1024.0**2))
+                    dh.close()
+                    continue
+                    
+                nBytes = download(dh, os.path.join(_MOVIE_PATH, movie), size=size,
+                                  chunkSize=int(args.chunk_kb*1024),
+                                  preallocate=args.preallocate, directIO=args.direct_io,
+                                  record=True)
+                upstreamBytes += nBytes
+                ledger.record('movies', nBytes)
+                ledger.flush()
             except Exception as e:
                 print("Error with %s: %s" % (movie, str(e)))
                 continue
                 
+        if deferred > 0:
+            print("Deferred %i movie download(s) from lwalab until the off-peak hours of %s" % (deferred, args.off_peak))
+            
+        # Report on where the movies came from
+        if len(manifests) > 0:
+            print("Downloaded %.1f MB from peers and %.1f MB from lwalab, saving %.1f MB of uplink traffic" % (peerBytes/1024.0**2, upstreamBytes/1024.0**2, peerBytes/1024.0**2))
+            
+        # Bring the checksums for the peer manifest up to date, dropping the
+        # movies that were deleted
+        build_manifest()
+        
+        # Poster frames for lwaTV3.py to show while a movie starts
+        if not args.no_posters:
+            update_posters(args)
+            
         # Report on disk usage
         diskUsage = 0
         currentMovies = glob.glob(os.path.join(_MOVIE_PATH, '*.mov'))
@@ -131,14 +944,41 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="simple script to update the list of pre-recorded movies used by the lwaTV.py script",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('-d', '--days', type=int, default=5,
+    parser.add_argument('-d', '--days', type=int, default=_DAYS_TO_STORE,
                         help='number of days to cache')
+    parser.add_argument('-b', '--max-mb', type=float,
+                        help='maximum amount of disk space in MB to use for movies')
+    parser.add_argument('-f', '--min-free-mb', type=float,
+                        help='amount of disk space in MB to always leave free')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='display status messages')
     parser.add_argument('-q', '--query', action='store_true',
                         help='query the cache')
     parser.add_argument('-2', '--lwatv2', action='store_true',
                         help='update movies from LWA-SV instead of LWA1')
+    parser.add_argument('-c', '--chunk-kb', type=float, default=_CHUNK_SIZE/1024,
+                        help='download chunk size in kB; see benchmarkDownload.py')
+    parser.add_argument('--preallocate', action='store_true',
+                        help='allocate the space for each movie before downloading it')
+    parser.add_argument('--direct-io', action='store_true',
+                        help='write movies with O_DIRECT to keep them out of the page cache')
+    parser.add_argument('-m', '--quota-mb', type=float, default=DEFAULT_QUOTA_MB,
+                        help=QUOTA_HELP)
+    parser.add_argument('--off-peak', type=str, default='0-6',
+                        help='local hours, as start-end, to download movies in when a quota is set')
+    parser.add_argument('--no-posters', action='store_true',
+                        help='do not make the poster frames that lwaTV3.py shows while a movie starts')
+    parser.add_argument('-p', '--peer', type=str, action='append',
+                        help='host[:port] of another kiosk to try before lwalab; can be given more than once')
+    parser.add_argument('--discover', action='store_true',
+                        help='look for other kiosks on the LAN to try before lwalab')
+    parser.add_argument('--serve', action='store_true',
+                        help='serve the movie cache to other kiosks instead of updating it')
+    parser.add_argument('--port', type=int, default=_PEER_PORT,
+                        help='port to serve the movie cache on')
     args = parser.parse_args()
-    main(args)
+    if args.serve:
+        serve(args)
+    else:
+        main(args)
     
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark for the movie download engine in updateMovies.py.  A test movie is
+served from a local HTTP server and downloaded with a range of chunk sizes,
+both with the old read()-based loop and with the readinto()-based engine, to
+find the settings that work best for a particular machine.
+"""
+
+import os
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from functools import partial
+from urllib.request import urlopen
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from updateMovies import download
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """
+    HTTP request handler that does not log every request.
+    """
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def run_server(directory, queue):
+    """
+    Serve 'directory' on an unused port and report the port on 'queue'.
+    """
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=directory))
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def download_read(dh, filename, chunkSize):
+    """
+    The original download loop that allocates a new bytes object for each
+    chunk.
+    """
+    
+    nBytes = 0
+    with open(filename, 'wb') as fh:
+        while True:
+            data = dh.read(chunkSize)
+            if len(data) == 0:
+                break
+            fh.write(data)
+            nBytes += len(data)
+    dh.close()
+    return nBytes
+
+
+def get_cpu_time():
+    """
+    Return the user+system CPU time used by this process.
+    """
+    
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def main(args):
+    workPath = tempfile.mkdtemp(prefix='lwatv-bench-')
+    server = None
+    try:
+        # Build the test movie
+        size = int(args.size_mb*1024**2)
+        with open(os.path.join(workPath, 'test.mov'), 'wb') as fh:
+            remaining = size
+            while remaining > 0:
+                fh.write(os.urandom(min(remaining, 1024**2)))
+                remaining -= min(remaining, 1024**2)
+                
+        # Start the server in its own process so that its CPU time is not
+        # counted against the download
+        queue = multiprocessing.Queue()
+        server = multiprocessing.Process(target=run_server, args=(workPath, queue))
+        server.daemon = True
+        server.start()
+        url = 'http://127.0.0.1:%i/test.mov' % queue.get(timeout=10)
+        
+        engines = ['read', 'readinto']
+        if args.preallocate or args.direct_io:
+            engines.append('readinto+%s' % '+'.join([name for name,flag in (('fallocate', args.preallocate),
+                                                                            ('direct', args.direct_io))
+                                                     if flag]))
+                                                     
+        print("%-26s %10s %10s %12s" % ('Engine', 'Chunk kB', 'MB/s', 'CPU s/GB'))
+        for chunkKB in args.chunk_kb:
+            chunkSize = int(chunkKB*1024)
+            for engine in engines:
+                filename = os.path.join(workPath, 'out.mov')
+                rates, cpus = [], []
+                for i in range(args.repeats):
+                    tStart = time.time()
+                    cStart = get_cpu_time()
+                    with urlopen(url) as dh:
+                        if engine == 'read':
+                            nBytes = download_read(dh, filename, chunkSize)
+                        else:
+                            extra = engine != 'readinto'
+                            nBytes = download(dh, filename, size=size, chunkSize=chunkSize,
+                                              preallocate=extra and args.preallocate,
+                                              directIO=extra and args.direct_io)
+                    tElapsed = time.time() - tStart
+                    cElapsed = get_cpu_time() - cStart
+                    if nBytes != size:
+                        raise RuntimeError("Downloaded %i B, expected %i B" % (nBytes, size))
+                    rates.append(nBytes/1024.0**2/tElapsed)
+                    cpus.append(cElapsed/(nBytes/1024.0**3))
+                    os.unlink(filename)
+                    
+                print("%-26s %10.0f %10.1f %12.2f" % (engine, chunkKB, max(rates), min(cpus)))
+    finally:
+        if server is not None:
+            server.terminate()
+        shutil.rmtree(workPath)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='benchmark the movie download engine against a local HTTP server',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+    parser.add_argument('-s', '--size-mb', type=float, default=256,
+                        help='size of the test movie in MB')
+    parser.add_argument('-c', '--chunk-kb', type=float, nargs='+', default=[64, 256, 1024, 4096],
+                        help='chunk sizes to test in kB')
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help='number of downloads per setting; the best is reported')
+    parser.add_argument('--preallocate', action='store_true',
+                        help='also test preallocating the file')
+    parser.add_argument('--direct-io', action='store_true',
+                        help='also test writing with O_DIRECT')
+    args = parser.parse_args()
+    main(args)
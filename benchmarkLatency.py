@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+"""
+End-to-end latency benchmark for lwaTV3.py.  The GUI is run under Xvfb
+against a local stand-in for lwalab that publishes LWATV frames filled with
+marker colors.  The screen is captured to find out when each frame shows up
+so that the distribution of publish-to-display latencies can be reported,
+along with the time it takes to switch to the beam pointings when the LWATV
+image goes stale.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+from io import BytesIO
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw, ImageGrab
+
+
+# Marker colors for the LWATV frames - frame i uses MARKERS[i % len(MARKERS)]
+MARKERS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0),
+           (0, 255, 255), (255, 128, 0), (128, 0, 255), (0, 128, 64)]
+
+
+# Marker color for the beam pointings
+BEAMS_MARKER = (255, 0, 255)
+
+
+def make_frame(color, size=(800, 600)):
+    """
+    Return the PNG data for a frame filled with the marker color 'color'.
+    """
+    
+    image = Image.new('RGB', size, color)
+    draw = ImageDraw.Draw(image)
+    draw.text((10, 10), 'marker %i,%i,%i' % color, fill=(0, 0, 0))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class StandInServer(object):
+    """
+    Class to serve lwatv.png and beamPointings.png the way lwalab does, with
+    the LWATV image and its Last-Modified time under our control.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames = [make_frame(color) for color in MARKERS]
+        self.beams = make_frame(BEAMS_MARKER)
+        self.index = 0
+        self.lastModified = time.time()
+        self.requests = 0
+        
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                with server.lock:
+                    server.requests += 1
+                    if path.endswith('/lwatv.png'):
+                        data = server.frames[server.index % len(server.frames)]
+                        lastModified = server.lastModified
+                    elif path.endswith('/beamPointings.png'):
+                        data = server.beams
+                        lastModified = time.time()
+                    else:
+                        self.send_error(404)
+                        return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Last-Modified', formatdate(lastModified, usegmt=True))
+                self.end_headers()
+                self.wfile.write(data)
+                
+            def log_message(self, format, *args):
+                pass
+                
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%i' % self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        
+    def publish(self):
+        """
+        Publish the next LWATV frame and return its marker color and the time
+        it was published.
+        """
+        
+        with self.lock:
+            self.index += 1
+            self.lastModified = time.time()
+            return MARKERS[self.index % len(MARKERS)], self.lastModified
+            
+    def go_stale(self, age=600):
+        """
+        Make the LWATV image look like it has not been updated in 'age' seconds
+        and return the time that happened.
+        """
+        
+        with self.lock:
+            self.lastModified = time.time() - age
+            return time.time()
+            
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+def find_marker(display, tolerance=24, minPixels=2000):
+    """
+    Capture the screen and return the marker color that covers the most of it,
+    or None if no marker covers at least 'minPixels' pixels.
+    """
+    
+    image = ImageGrab.grab(xdisplay=display).convert('RGB')
+    image = image.reduce(4)
+    minPixels = minPixels // 16
+    
+    counts = {}
+    for count,color in image.getcolors(image.size[0]*image.size[1]):
+        for marker in MARKERS+[BEAMS_MARKER]:
+            if max([abs(c-m) for c,m in zip(color, marker)]) <= tolerance:
+                counts[marker] = counts.get(marker, 0) + count
+                break
+    if len(counts) == 0:
+        return None
+    marker = max(counts, key=counts.get)
+    return marker if counts[marker] >= minPixels else None
+
+
+def wait_for_marker(display, marker, timeout, interval=0.05):
+    """
+    Wait for 'marker' to be the main marker on the screen and return the time
+    that it was seen, or None if that did not happen within 'timeout' seconds.
+    """
+    
+    tStop = time.time() + timeout
+    while time.time() < tStop:
+        if find_marker(display) == marker:
+            return time.time()
+        time.sleep(interval)
+    return None
+
+
+def summarize(name, values):
+    if len(values) == 0:
+        print("%s: no measurements" % name)
+        return
+        
+    values = sorted(values)
+    n = len(values)
+    print("%s (%i measurements):" % (name, n))
+    print("  min %.2f s, median %.2f s, 90%% %.2f s, max %.2f s" % (values[0], values[n//2], values[min([n-1, int(0.9*n)])], values[-1]))
+
+
+def main(args):
+    for tool in ('Xvfb',):
+        if shutil.which(tool) is None:
+            print("%s is needed to run this benchmark" % tool)
+            sys.exit(1)
+            
+    server = StandInServer()
+    display = ':%i' % args.display
+    xvfb = subprocess.Popen(['Xvfb', display, '-screen', '0', '1310x840x24', '-nolisten', 'tcp'])
+    gui = None
+    try:
+        time.sleep(1)
+        
+        # Start the GUI
+        env = dict(os.environ)
+        env['DISPLAY'] = display
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lwaTV3.py')
+        cmd = [sys.executable, script, '--base-url', server.url, '--disable-movie']
+        cmd.extend(args.gui_args)
+        print("Running %s" % ' '.join(cmd))
+        gui = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL if not args.verbose else None)
+        
+        # Startup
+        tStart = time.time()
+        marker = MARKERS[0]
+        tSeen = wait_for_marker(display, marker, args.timeout)
+        if tSeen is None:
+            print("The first frame never showed up")
+            sys.exit(1)
+        print("First frame shown %.2f s after starting the GUI" % (tSeen - tStart))
+        
+        # Publish-to-display latency
+        latencies = []
+        for i in range(args.frames):
+            # Spread the publish times across the polling cycle
+            time.sleep(args.interval*(0.5 + (i % 7)/7.0))
+            marker, tPublish = server.publish()
+            tSeen = wait_for_marker(display, marker, args.timeout)
+            if tSeen is None:
+                print("Frame %i never showed up" % i)
+                continue
+            latencies.append(tSeen - tPublish)
+            if args.verbose:
+                print("Frame %i shown after %.2f s" % (i, latencies[-1]))
+                
+        # Mode switch latency
+        switches, returns = [], []
+        for i in range(args.switches):
+            tStale = server.go_stale()
+            tSeen = wait_for_marker(display, BEAMS_MARKER, args.timeout)
+            if tSeen is not None:
+                switches.append(tSeen - tStale)
+                
+            marker, tPublish = server.publish()
+            tSeen = wait_for_marker(display, marker, args.timeout)
+            if tSeen is not None:
+                returns.append(tSeen - tPublish)
+                
+        print("%i requests made to the stand-in server" % server.requests)
+        summarize("Publish-to-display latency", latencies)
+        summarize("LWATV -> beam pointings switch latency", switches)
+        summarize("Beam pointings -> LWATV switch latency", returns)
+    finally:
+        if gui is not None:
+            gui.terminate()
+            try:
+                gui.wait(10)
+            except subprocess.TimeoutExpired:
+                gui.kill()
+        xvfb.terminate()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='measure the publish-to-display latency of lwaTV3.py under Xvfb',
+        epilog='any arguments after a "--" are passed to lwaTV3.py',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+    parser.add_argument('-d', '--display', type=int, default=99,
+                        help='X display number to use for Xvfb')
+    parser.add_argument('-f', '--frames', type=int, default=20,
+                        help='number of frames to publish')
+    parser.add_argument('-i', '--interval', type=float, default=10.0,
+                        help='average interval in seconds between published frames')
+    parser.add_argument('-s', '--switches', type=int, default=3,
+                        help='number of LWATV/beam pointings mode switches to time')
+    parser.add_argument('-t', '--timeout', type=float, default=60.0,
+                        help='how long to wait for a frame to show up in seconds')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='display the GUI output and the individual latencies')
+    parser.add_argument('gui_args', nargs='*',
+                        help='extra arguments for lwaTV3.py')
+    args = parser.parse_args()
+    main(args)
@@ -9,137 +9,2477 @@ import wx
 import sys
 import copy
 import glob
+import json
 import math
 import time
+import uuid
+import hashlib
 import random
+import signal
+import struct
+import calendar
 import argparse
+import platform
+import tempfile
+import threading
+import traceback
+import queue
 from urllib.request import urlopen
 from datetime import datetime
+from functools import wraps
+from contextlib import contextmanager
+from collections import namedtuple
+from multiprocessing import get_context, shared_memory
 from PIL import Image as PImage
+from PIL import ImageChops, ImageFile, ImageStat
 from io import BytesIO
 
+from updateMovies import BandwidthLedger, DEFAULT_QUOTA_MB, QUOTA_HELP
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Reference time for --startup-profile
+_START_TIME = time.time()
+
 os.environ['WXSUPPRESS_SIZER_FLAGS_CHECK'] = '1'
 
-if sys.platform.startswith('linux'):
-    import ctypes
-    try:
-        x11 = ctypes.cdll.LoadLibrary('libX11.so')
-        x11.XInitThreads()
-    except:
-        pass
-        
-import gi
-gi.require_version('Gst', '1.0')
-gi.require_version('GstVideo', '1.0')
-from gi.repository import GObject, Gst
-from gi.repository import GstVideo
+# GStreamer is only loaded if the movie panel needs it, see initGStreamer()
+GObject = Gst = GstVideo = None
+
 
-GObject.threads_init()
-Gst.init(None)
+def initX11Threads():
+    """
+    Enable Xlib thread support so that GStreamer can share the X connection.
+    This needs to be called before the first X connection is opened.
+    """
+    
+    if sys.platform.startswith('linux'):
+        import ctypes
+        try:
+            x11 = ctypes.cdll.LoadLibrary('libX11.so')
+            x11.XInitThreads()
+        except:
+            pass
+
+
+def initGStreamer():
+    """
+    Import and initialize GStreamer 1.0, if that has not already been done.
+    """
+    
+    global GObject, Gst, GstVideo
+    if Gst is not None:
+        return
+        
+    import gi
+    gi.require_version('Gst', '1.0')
+    gi.require_version('GstVideo', '1.0')
+    from gi.repository import GObject, Gst
+    from gi.repository import GstVideo
+    
+    GObject.threads_init()
+    Gst.init(None)
 
 # Deal with the different wxPython versions
 if 'phoenix' in wx.PlatformInfo:
     EnableLogging = wx.Log.EnableLogging
     ClientDC = wx.ClientDC
     Image = wx.Image
+    EmptyImage = wx.Image
     Bitmap = wx.Bitmap
 else:
     EnableLogging = wx.Log_EnableLogging
     ClientDC = wx.AutoBufferedPaintDC
     Image = wx.ImageFromStream
+    EmptyImage = wx.EmptyImage
     Bitmap = wx.BitmapFromImage
 
 
-class MoviePlayer(wx.Panel):
+# Image modes, in the order used for the mode codes in SharedFrameBuffer
+IMAGE_MODES = ['', 'LWATV', 'Beams', 'Error']
+
+
+LatestImage = namedtuple('LatestImage', ['mode', 'data', 'lastModified', 'status'])
+
+
+# Where the latest images come from
+LWALAB_URL = 'https://lwalab.phys.unm.edu'
+
+
+def getLatestURLs(lwatv2=False, baseURL=LWALAB_URL):
+    """
+    Return a two-element tuple of the URLs for the latest LWATV image and for
+    the current beam pointings.
+    """
+    
+    channel = 'lwatv2' if lwatv2 else 'lwatv'
+    stamp = int(time.time())
+    url = '%s/%s/lwatv.png?lwatvgui=%i' % (baseURL, channel, stamp)
+    urlAlt = '%s/%s/beamPointings.png?lwatvgui=%i' % (baseURL, channel, stamp)
+    return url, urlAlt
+
+
+def getMovieURL(movie, lwatv2=False, baseURL=LWALAB_URL):
+    """
+    Return the URL that updateMovies.py downloads the movie 'movie', e.g.,
+    '60000.mov', from.
+    """
+    
+    channel = 'lwatv2' if lwatv2 else 'lwatv'
+    return '%s/%s/%s' % (baseURL, channel, movie)
+
+
+def _readResponse(fh, progress=None, chunkSize=16384):
+    """
+    Read the body of the open URL 'fh'.  If 'progress' is given the body is
+    read in chunks and progress(chunk, total) is called for each of them,
+    where 'total' is the expected size or None if that is not known.
+    """
+    
+    if progress is None:
+        return fh.read()
+        
+    total = fh.headers.get('Content-Length', None)
+    if total is not None:
+        total = int(total)
+    chunks = []
+    while True:
+        chunk = fh.read(chunkSize)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        progress(chunk, total)
+    return b''.join(chunks)
+
+
+class SpeculativeRequest(object):
+    """
+    Class to open a URL in a background thread so that the response is ready
+    to read if it turns out to be needed.  If it is not, cancel() closes the
+    response without reading the body.
+    """
+    
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.response = None
+        self.error = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+        
+        self._thread = threading.Thread(target=self._open, args=(timeout,))
+        self._thread.daemon = True
+        self._thread.start()
+        
+    def _open(self, timeout):
+        try:
+            response = urlopen(self.url, timeout=timeout)
+        except Exception as e:
+            self.error = e
+            return
+            
+        with self._lock:
+            if self.cancelled:
+                response.close()
+            else:
+                self.response = response
+                
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self.response is not None:
+                self.response.close()
+                self.response = None
+                
+    def read(self, timeout=30, progress=None):
+        """
+        Wait for the response and return its body.
+        """
+        
+        self._thread.join(timeout)
+        with self._lock:
+            response, self.response = self.response, None
+            self.cancelled = True
+        if response is None:
+            raise self.error or IOError("Timed out opening %s" % self.url)
+            
+        try:
+            return _readResponse(response, progress)
+        finally:
+            response.close()
+
+
+def fetchLatestImage(imagePath, lwatv2=False, speculative=False, progress=None, baseURL=LWALAB_URL, timeout=30):
+    """
+    Download the latest LWATV image, falling back to the current beam pointings
+    if the image is too old to think that LASI is running and to the stock
+    error image if the download fails.  Returns a LatestImage instance.
+    
+    The age of the image is checked from the headers before the image itself
+    is downloaded.  If 'speculative' is True the beam pointings are requested
+    at the same time as the image so that either mode takes one round trip.
+    If 'progress' is given it is called as the image data arrive, see
+    _readResponse().  Requests that take longer than 'timeout' seconds to
+    connect or stall count as download errors.
+    """
+    
+    url, urlAlt = getLatestURLs(lwatv2, baseURL)
+    
+    status = "Download at %s" % url
+    lm = None
+    beams = None
+    try:
+        if speculative:
+            beams = SpeculativeRequest(urlAlt, timeout=timeout)
+            
+        # Try to get the latest image...
+        fh = urlopen(url, timeout=timeout)
+        
+        info = fh.info()
+        lm = info.get("last-modified")
+        lm = datetime.strptime(lm, "%a, %d %b %Y %H:%M:%S GMT")
+        age = datetime.utcnow() - lm
+        age = age.days*24*3600 + age.seconds
+        
+        # Is the image recent enough to think that TBN/PASI is running?
+        if age > 120:
+            fh.close()
+            if beams is not None:
+                data = beams.read(timeout=timeout, progress=progress)
+            else:
+                fh = urlopen(urlAlt, timeout=timeout)
+                data = _readResponse(fh, progress)
+                fh.close()
+                
+            status = status+" -> LASI is not currently running"
+            mode = 'Beams'
+        else:
+            data = _readResponse(fh, progress)
+            fh.close()
+            
+            mode = 'LWATV'
+            
+    except:
+        # Deal with network/download errors
+        fh = open(os.path.join(imagePath, 'error.png'), 'rb')
+        data = fh.read()
+        fh.close()
+        
+        status = status+" -> error"
+        mode = 'Error'
+        
+    finally:
+        # The beam pointings were not needed
+        if beams is not None:
+            beams.cancel()
+            
+    return LatestImage(mode, data, lm, status)
+
+
+class ProgressiveFetch(object):
+    """
+    Class to run fetchLatestImage() in a background thread while keeping the
+    data that have arrived so far so that the GUI can show the download in
+    progress.  The data are fed to an ImageFile.Parser until the image header
+    has been parsed so that the GUI knows when a partial decode is possible.
+    If 'onDone' is given it is called from the background thread once the
+    download has finished.
+    """
+    
+    def __init__(self, imagePath, lwatv2=False, speculative=False, baseURL=LWALAB_URL, onDone=None):
+        self.imagePath = imagePath
+        self.lwatv2 = lwatv2
+        self.speculative = speculative
+        self.baseURL = baseURL
+        self.onDone = onDone
+        
+        self.tPoll = time.time()
+        self.result = None
+        self.size = None
+        self.total = None
+        self.data = bytearray()
+        self._parser = ImageFile.Parser()
+        self._lock = threading.Lock()
+        
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        
+    def _run(self):
+        self.result = fetchLatestImage(self.imagePath, self.lwatv2,
+                                       speculative=self.speculative, progress=self._progress,
+                                       baseURL=self.baseURL)
+        if self.onDone is not None:
+            self.onDone()
+            
+
+    def _progress(self, chunk, total):
+        with self._lock:
+            self.data.extend(chunk)
+            self.total = total
+            
+        if self.size is None:
+            try:
+                self._parser.feed(chunk)
+                if self._parser.image is not None:
+                    self.size = self._parser.image.size
+                    self._parser = None
+            except Exception:
+                self._parser = None
+                self.size = (0, 0)
+                
+    def done(self):
+        return self.result is not None
+        
+    def getProgress(self):
+        """
+        Return a three-element tuple of the data received so far, the fraction
+        of the image that has been received (None if that is not known), and
+        whether or not the image header has been parsed.
+        """
+        
+        with self._lock:
+            data = bytes(self.data)
+            total = self.total
+        fraction = len(data)/float(total) if total else None
+        return data, fraction, self.size is not None and self.size != (0, 0)
+
+
+class PollScheduler(object):
+    """
+    Class to decide when to poll for the latest image.  In adaptive mode the
+    update interval is learned from successive Last-Modified values so that
+    polls land just after the next expected update, the beam pointings are
+    polled less often, errors back off exponentially, and a per-kiosk jitter
+    keeps a fleet of displays from polling in lockstep.  Otherwise, the image
+    is polled every 'interval' seconds.
+    
+    If a BandwidthLedger is given the downloads are recorded in it and, if
+    there is also a daily 'quota' in bytes, the polls are spread out so that
+    the rest of the day's polls fit within the quota.
+    """
+    
+    def __init__(self, adaptive=False, interval=5.0, minInterval=2.0, maxInterval=60.0,
+                 beamsInterval=30.0, maxBackoff=300.0, margin=1.0, jitter=0.1,
+                 ledger=None, quota=0.0, flushInterval=60.0):
+        self.adaptive = adaptive
+        self.interval = interval
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.beamsInterval = beamsInterval
+        self.maxBackoff = maxBackoff
+        self.margin = margin
+        self.jitter = jitter
+        
+        self.learnedInterval = None
+        self.lastModified = None
+        self.errors = 0
+        self.nextPoll = 0.0
+        
+        self.ledger = ledger
+        self.quota = quota
+        self.flushInterval = flushInterval
+        self.pollBytes = None
+        self.floor = 0.0
+        
+        # Seed the jitter with something unique to this machine so that the
+        # offset is stable for a kiosk but different across kiosks
+        self._random = random.Random(uuid.getnode())
+        self.offset = self._random.uniform(0, margin)
+        
+    def due(self):
+        return time.time() >= self.nextPoll
+        
+    def getDelay(self, latest, tPoll):
+        """
+        Return the delay in seconds between the poll started at 'tPoll' that
+        returned the LatestImage 'latest' and the next poll.
+        """
+        
+        if not self.adaptive:
+            return self.interval
+            
+        # Errors - back off
+        if latest.mode == 'Error':
+            self.errors += 1
+            return min([self.interval*2**(self.errors-1), self.maxBackoff])
+        self.errors = 0
+        
+        # Beam pointings - these change slowly
+        if latest.mode == 'Beams':
+            return self.beamsInterval
+            
+        # LWATV - learn the update interval from Last-Modified
+        lm = calendar.timegm(latest.lastModified.timetuple())
+        if self.lastModified is not None and lm > self.lastModified:
+            dt = lm - self.lastModified
+            if self.learnedInterval is None:
+                self.learnedInterval = dt
+            else:
+                self.learnedInterval = 0.7*self.learnedInterval + 0.3*dt
+        self.lastModified = lm
+        if self.learnedInterval is None:
+            return self.interval
+            
+        # Aim for just after the next expected update.  If that has already
+        # passed the update is late so check again soon.
+        expected = self.lastModified + self.learnedInterval + self.margin
+        if expected <= tPoll:
+            return max([self.minInterval, self.learnedInterval/4])
+        return expected - tPoll
+        
+    def update(self, latest, tPoll=None):
+        """
+        Schedule the next poll based on the results of the current one.
+        """
+        
+        if tPoll is None:
+            tPoll = time.time()
+        self.account(latest)
+        delay = self.getDelay(latest, tPoll)
+        if self.adaptive:
+            if latest.mode != 'Error':
+                delay = min([max([self.minInterval, delay]), self.maxInterval])
+            delay = delay*(1 + self._random.uniform(-self.jitter, self.jitter)) + self.offset
+        delay = max([delay, self.floor])
+        self.nextPoll = tPoll + delay
+        return delay
+        
+    def account(self, latest):
+        """
+        Record the download in the ledger and update the quota-based minimum
+        poll interval.
+        """
+        
+        if self.ledger is None or latest.mode == 'Error':
+            return
+            
+        nBytes = len(latest.data)
+        self.ledger.record('images', nBytes)
+        if time.time() - self.ledger.lastFlush > self.flushInterval:
+            self.ledger.flush()
+            
+        if self.quota > 0:
+            if self.pollBytes is None:
+                self.pollBytes = nBytes
+            self.pollBytes = 0.8*self.pollBytes + 0.2*nBytes
+            self.floor = self.ledger.get_poll_interval(self.quota, self.pollBytes)
+
+
+class ChangeDetector(object):
+    """
+    Class to decide if a new image is worth showing.  The raw image data are
+    compared by hash and the decoded images with the mean absolute difference
+    of small grayscale thumbnails.
+    """
+    
+    def __init__(self, threshold=1.0, thumbSize=(64, 64)):
+        self.threshold = threshold
+        self.thumbSize = thumbSize
+        self.digest = None
+        self.thumb = None
+        
+    def isSame(self, data):
+        """
+        Return True if the raw image data are the same as last time.
+        """
+        
+        digest = hashlib.sha1(data).digest()
+        same = (digest == self.digest)
+        self.digest = digest
+        return same
+        
+    def isNearlySame(self, image):
+        """
+        Return True if the decoded PIL image is nearly the same as last time.
+        """
+        
+        thumb = image.convert('L').resize(self.thumbSize, PImage.BOX)
+        same = False
+        if self.thumb is not None:
+            diff = ImageChops.difference(thumb, self.thumb)
+            same = ImageStat.Stat(diff).mean[0] < self.threshold
+        self.thumb = thumb
+        return same
+
+
+def changedRegion(old, new, pad=2):
+    """
+    Return the (left, upper, right, lower) box that contains all of the pixels
+    that differ between two PIL images of the same size, or None if they are
+    identical.
+    """
+    
+    bbox = ImageChops.difference(old, new).getbbox()
+    if bbox is None:
+        return None
+        
+    x0, y0, x1, y1 = bbox
+    w, h = new.size
+    return max([0, x0-pad]), max([0, y0-pad]), min([w, x1+pad]), min([h, y1+pad])
+
+
+# ImageFile.LOAD_TRUNCATED_IMAGES is global so decodes take turns to make sure
+# that only the ones that ask for it see it set
+_decodeLock = threading.Lock()
+
+
+def decodeForSize(data, size, truncated=False):
+    """
+    Decode image data into a PIL RGB image that is no smaller than needed to
+    fill a panel of the given (width, height) while keeping its aspect ratio.
+    JPEGs are decoded in draft mode so that the downscaling happens as part of
+    the decode and other formats are box-reduced by an integer factor right
+    after decoding.  If 'truncated' is True images that are cut short are
+    decoded anyway.
+    """
+    
+    with _decodeLock:
+        saved = ImageFile.LOAD_TRUNCATED_IMAGES
+        ImageFile.LOAD_TRUNCATED_IMAGES = truncated
+        try:
+            image = PImage.open(BytesIO(data))
+            wi, hi = image.size
+            wd, hd = size
+            if wd <= 0 or hd <= 0:
+                return image.convert('RGB')
+                
+            s = min([1.0*wd/wi, 1.0*hd/hi])
+            target = (max([1, int(math.ceil(wi*s))]), max([1, int(math.ceil(hi*s))]))
+            if image.format == 'JPEG':
+                image.draft('RGB', target)
+            image = image.convert('RGB')
+        finally:
+            ImageFile.LOAD_TRUNCATED_IMAGES = saved
+            
+    factor = int(min([image.size[0]//target[0], image.size[1]//target[1]]))
+    if factor > 1:
+        image = image.reduce(factor)
+    return image
+
+
+def decodePartial(data, size):
+    """
+    Decode as much of the partially downloaded image 'data' as possible with
+    decodeForSize().  The rows that have not arrived yet are black.  Returns
+    None if there is not enough to decode.
+    """
+    
+    try:
+        return decodeForSize(data, size, truncated=True)
+    except Exception:
+        return None
+
+
+def fitToPanel(image, size, resample=PImage.BILINEAR):
+    """
+    Scale a PIL image to fit within the given (width, height) while keeping its
+    aspect ratio and center it on a black background of that size.
+    """
+    
+    wi, hi = image.size
+    wd, hd = size
+    s = min([1.0*wd/wi, 1.0*hd/hi])
+    w, h = max([1, int(round(wi*s))]), max([1, int(round(hi*s))])
+    
+    canvas = PImage.new('RGB', (wd, hd))
+    canvas.paste(image.resize((w, h), resample), ((wd-w)//2, (hd-h)//2))
+    return canvas
+
+
+def pilToWx(image):
+    """
+    Convert a PIL image into a wx.Image.
+    """
+    
+    image = image.convert('RGB')
+    wxImage = EmptyImage(*image.size)
+    wxImage.SetData(image.tobytes())
+    return wxImage
+
+
+def drawFitted(wxImage, panel, quality=wx.IMAGE_QUALITY_NORMAL):
+    """
+    Draw a wx.Image centered in a panel, scaling it to fit if needed.
+    """
+    
+    wi, hi = wxImage.GetSize()
+    wd, hd = panel.GetSize()
+    if wd <= 0 or hd <= 0:
+        return
+        
+    if (wi, hi) != (wd, hd):
+        s = min([1.0*wd/wi, 1.0*hd/hi])
+        w, h = max([1, int(round(wi*s))]), max([1, int(round(hi*s))])
+        wxImage = wxImage.Scale(w, h, quality)
+        wxImage.Resize((wd, hd), ((wd-w)//2, (hd-h)//2), 0, 0, 0)
+    bitmap = Bitmap(wxImage)
+    
+    dc = ClientDC(panel)
+    dc.DrawBitmap(bitmap, 0, 0)
+
+
+class FrameRing(object):
+    """
+    Memory bounded ring buffer of recent LWATV frames for time-lapse replays.
+    The frames are scaled to a fixed size and, optionally, quantized to a 256
+    color palette before they are stored in a preallocated array.  The array is
+    allocated when the first frame is added so that the frame size can follow
+    the size of the panel that they will be shown in.
+    """
+    
+    def __init__(self, budget, quantize=False):
+        if numpy is None:
+            raise RuntimeError("The time-lapse buffer requires numpy")
+            
+        self.budget = int(budget)
+        self.quantize = quantize
+        self.size = None
+        self.capacity = 0
+        self.count = 0
+        self.head = 0
+        
+    def allocate(self, size):
+        w, h = size
+        frameBytes = w*h*(1 if self.quantize else 3) + (768 if self.quantize else 0) + 8
+        self.capacity = self.budget // frameBytes
+        if self.capacity < 2:
+            raise ValueError("Time-lapse budget of %i B is too small for %ix%i frames" % (self.budget, w, h))
+            
+        if self.quantize:
+            self.frames = numpy.zeros((self.capacity, h, w), dtype=numpy.uint8)
+            self.palettes = numpy.zeros((self.capacity, 768), dtype=numpy.uint8)
+        else:
+            self.frames = numpy.zeros((self.capacity, h, w, 3), dtype=numpy.uint8)
+        self.times = numpy.zeros(self.capacity, dtype=numpy.float64)
+        self.size = (w, h)
+        self.count = 0
+        self.head = 0
+        
+    def __len__(self):
+        return self.count
+        
+    def add(self, image, size, t):
+        """
+        Add a PIL image taken at time 't' to the buffer, scaling it to fit
+        within 'size'.  The size is fixed by the first call.
+        """
+        
+        if self.size is None:
+            self.allocate(size)
+            
+        image = fitToPanel(image.convert('RGB'), self.size)
+        if self.quantize:
+            image = image.quantize(256)
+            palette = image.getpalette()[:768]
+            self.palettes[self.head,:len(palette)] = palette
+        self.frames[self.head] = numpy.asarray(image)
+        self.times[self.head] = t
+        
+        self.head = (self.head + 1) % self.capacity
+        self.count = min([self.count + 1, self.capacity])
+        
+    def _index(self, i):
+        return (self.head - self.count + i) % self.capacity
+        
+    def get(self, i):
+        """
+        Return the i-th oldest frame in the buffer as a PIL RGB image.
+        """
+        
+        j = self._index(i)
+        if self.quantize:
+            image = PImage.fromarray(self.frames[j])
+            image.putpalette(self.palettes[j].tobytes())
+            return image.convert('RGB')
+        return PImage.fromarray(self.frames[j])
+        
+    def getTime(self, i):
+        return self.times[self._index(i)]
+        
+    def getSpan(self):
+        """
+        Return the time in seconds covered by the buffer.
+        """
+        
+        if self.count < 2:
+            return 0.0
+        return self.getTime(self.count-1) - self.getTime(0)
+
+
+class SharedFrameBuffer(object):
+    """
+    Double buffered block of shared memory for handing display-ready RGB frames
+    from the fetcher process to the GUI.  The header holds a sequence counter
+    that is incremented after each frame is written and the size of the latest
+    image panel as requested by the GUI.  Each of the two slots holds the image
+    mode code, the frame size, and the pixel data.
+    """
+    
+    _header = struct.Struct('<QII')
+    _slotHeader = struct.Struct('<III')
+    
+    def __init__(self, width, height, name=None):
+        self.width = width
+        self.height = height
+        self.slotSize = self._slotHeader.size + width*height*3
+        size = self._header.size + 2*self.slotSize
+        
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+            self._header.pack_into(self.shm.buf, 0, 0, 0, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            
+    @property
+    def name(self):
+        return self.shm.name
+        
+    def getSequence(self):
+        return struct.unpack_from('<Q', self.shm.buf, 0)[0]
+        
+    def getPanelSize(self):
+        return struct.unpack_from('<II', self.shm.buf, 8)
+        
+    def setPanelSize(self, width, height):
+        struct.pack_into('<II', self.shm.buf, 8, width, height)
+        
+    def write(self, mode, image):
+        """
+        Write a PIL RGB image into the idle slot and then publish it by bumping
+        the sequence counter.
+        """
+        
+        w, h = image.size
+        if w > self.width or h > self.height:
+            raise ValueError("Frame of %ix%i is larger than the %ix%i buffer" % (w, h, self.width, self.height))
+            
+        seq = self.getSequence()
+        offset = self._header.size + ((seq+1) % 2)*self.slotSize
+        self._slotHeader.pack_into(self.shm.buf, offset, IMAGE_MODES.index(mode), w, h)
+        offset += self._slotHeader.size
+        self.shm.buf[offset:offset+w*h*3] = image.tobytes()
+        struct.pack_into('<Q', self.shm.buf, 0, seq+1)
+        
+    def read(self, after=0):
+        """
+        Return a five-element tuple of the sequence number, image mode, width,
+        height, and RGB data for the most recent frame, or None if there is no
+        frame newer than sequence number 'after'.
+        """
+        
+        while True:
+            seq = self.getSequence()
+            if seq == 0 or seq == after:
+                return None
+                
+            offset = self._header.size + (seq % 2)*self.slotSize
+            code, w, h = self._slotHeader.unpack_from(self.shm.buf, offset)
+            offset += self._slotHeader.size
+            data = bytes(self.shm.buf[offset:offset+w*h*3])
+            
+            # Make sure that the frame was not overwritten while we copied it
+            if self.getSequence() == seq:
+                return seq, IMAGE_MODES[code], w, h, data
+                
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Encoders that MovieRecorder can use, in order of preference
+MOVIE_ENCODERS = ['x264enc', 'avenc_mpeg4', 'jpegenc']
+
+
+def findMovieEncoder():
+    """
+    Return the name of the best encoder in MOVIE_ENCODERS that is available or
+    None if there are none, or if GStreamer cannot be loaded.
+    """
+    
+    try:
+        initGStreamer()
+    except (ImportError, ValueError):
+        return None
+    for encoder in MOVIE_ENCODERS:
+        if Gst.ElementFactory.find(encoder) is not None:
+            return encoder
+    return None
+
+
+class MovieRecorder(object):
+    """
+    Class to encode new LWATV frames into a daily movie with a GStreamer
+    appsrc -> encoder -> mux pipeline so that updateMovies.py does not need to
+    download it.  Frames are written to movies/<mjd>.mov.rec and the file is
+    renamed to <mjd>.mov when the MJD rolls over.  Days that were not recorded
+    from the start are discarded so that the full movie is still downloaded.
+    Frames are decoded and encoded in a worker thread.
+    """
+    
+    def __init__(self, moviePath, fps=10, verbose=False):
+        initGStreamer()
+        
+        self.moviePath = moviePath
+        self.fps = fps
+        self.verbose = verbose
+        self.startTime = time.time()
+        
+        self.encoder = findMovieEncoder()
+        if self.encoder is None:
+            raise RuntimeError("No suitable GStreamer video encoder found")
+            
+        self.pipeline = None
+        self.mjd = None
+        
+        self.queue = queue.Queue()
+        self.worker = None
+        
+    def _start(self, mjd, size):
+        self.mjd = mjd
+        self.size = size
+        self.nFrames = 0
+        self.filename = os.path.join(self.moviePath, '%i.mov.rec' % mjd)
+        if not os.path.exists(self.moviePath):
+            os.mkdir(self.moviePath)
+            
+        # Recordings left over from before this recorder started cannot be
+        # finished
+        for filename in glob.glob(os.path.join(self.moviePath, '*.mov.rec')):
+            try:
+                if os.path.getmtime(filename) < self.startTime:
+                    os.unlink(filename)
+            except OSError:
+                pass
+            
+        caps = 'video/x-raw,format=RGB,width=%i,height=%i,framerate=%i/1' % (size[0], size[1], self.fps)
+        self.pipeline = Gst.parse_launch('appsrc name=src format=time max-bytes=0 caps=%s ! videoconvert ! %s ! qtmux ! filesink location="%s"' % (caps, self.encoder, self.filename))
+        self.src = self.pipeline.get_by_name('src')
+        self.pipeline.set_state(Gst.State.PLAYING)
+        if self.verbose:
+            print("Recording movie for MJD %i to %s" % (mjd, self.filename))
+            
+    def _finish(self, pipeline, src, mjd, filename, register):
+        # Send EOS so that qtmux can write out the headers
+        src.emit('end-of-stream')
+        msg = pipeline.get_bus().timed_pop_filtered(30*Gst.SECOND, Gst.MessageType.EOS|Gst.MessageType.ERROR)
+        pipeline.set_state(Gst.State.NULL)
+        
+        final = os.path.join(self.moviePath, '%i.mov' % mjd)
+        if register and msg is not None and msg.type == Gst.MessageType.EOS and not os.path.exists(final):
+            os.rename(filename, final)
+            if self.verbose:
+                print("Recorded movie for MJD %i saved to %s" % (mjd, final))
+        else:
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+                
+    def finish(self, wait=False):
+        """
+        Finish the current movie, registering it if it is complete.
+        """
+        
+        # Stop the worker once it has caught up
+        if self.worker is not None:
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
+        self._finishMovie(wait=wait)
+        
+    def _finishMovie(self, wait=False):
+        if self.pipeline is None:
+            return
+            
+        # Was the recorder running at the start of the day?
+        register = self.nFrames > 0 and self.startTime <= (self.mjd + 2400000.5 - 2440587.5)*86400.0
+        finisher = threading.Thread(target=self._finish, args=(self.pipeline, self.src, self.mjd, self.filename, register))
+        finisher.start()
+        if wait:
+            finisher.join()
+        self.pipeline = None
+        
+    def addFrame(self, image, t):
+        """
+        Queue a PIL image, or the encoded data for one, with a Last-Modified
+        time of 't' to be added to the recording.
+        """
+        
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run)
+            self.worker.daemon = True
+            self.worker.start()
+        self.queue.put((image, t))
+        
+    def _run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+                
+            image, t = frame
+            try:
+                if not isinstance(image, PImage.Image):
+                    image = decodeForSize(image, (0, 0))
+                self._addFrame(image, t)
+            except Exception as e:
+                print("Error recording frame: %s" % str(e))
+                
+    def _addFrame(self, image, t):
+        mjd = int(t/86400.0 + 2440587.5 - 2400000.5)
+        if self.pipeline is not None and mjd != self.mjd:
+            self._finishMovie()
+        if self.pipeline is None:
+            self._start(mjd, image.size)
+            
+        image = image.convert('RGB')
+        if image.size != self.size:
+            image = fitToPanel(image, self.size)
+        buf = Gst.Buffer.new_wrapped(image.tobytes())
+        buf.pts = self.nFrames*Gst.SECOND//self.fps
+        buf.duration = Gst.SECOND//self.fps
+        self.src.emit('push-buffer', buf)
+        self.nFrames += 1
+
+
+def runFrameFetcher(name, width, height, imagePath, lwatv2, fade, fadeTime, stopEvent, verbose=False, adaptive=False, moviePath=None, speculative=False, ledgerFile=None, quota=0.0, baseURL=LWALAB_URL):
+    """
+    Main loop for the fetcher process used by --split-fetcher.  This downloads,
+    decodes, fades, and scales the latest image so that the GUI only has to
+    blit the frames that appear in the shared frame buffer.  If 'moviePath' is
+    given new LWATV frames are also recorded into daily movies there.  If
+    'ledgerFile' is given the downloads are recorded in that BandwidthLedger
+    and polled within the daily 'quota' in bytes.
+    """
+    
+    frames = SharedFrameBuffer(width, height, name=name)
+    ledger = BandwidthLedger(ledgerFile) if ledgerFile is not None else None
+    poller = PollScheduler(adaptive=adaptive, ledger=ledger, quota=quota)
+    changes = ChangeDetector()
+    recorder = None
+    if moviePath is not None:
+        try:
+            recorder = MovieRecorder(moviePath, verbose=verbose)
+        except Exception as e:
+            print("WARNING: %s, disabling movie recording" % str(e))
+    try:
+        lastModified = None
+        latestData = None
+        decodeSize = (0, 0)
+        pilLatestImage = pilLatestImageOld = None
+        pilLatestImageTime = 0
+        mode = ''
+        rendered, renderedSize = False, None
+        while not stopEvent.is_set():
+            # Keep going if something goes wrong with one image so that the
+            # GUI does not need to restart the process
+            try:
+                latest = None
+                if poller.due():
+                    tPoll = time.time()
+                    latest = fetchLatestImage(imagePath, lwatv2, speculative=speculative, baseURL=baseURL)
+                    delay = poller.update(latest, tPoll)
+                    if verbose:
+                        print(latest.status)
+                        print("Next poll in %.1f s" % delay)
+                        
+                size = frames.getPanelSize()
+                size = (min([size[0], width]), min([size[1], height]))
+                if latest is not None and not changes.isSame(latest.data):
+                    mode = latest.mode
+                    latestData = latest.data
+                    decodeSize = size
+                    pilLatestImageOld = pilLatestImage
+                    pilLatestImage = decodeForSize(latestData, decodeSize)
+                    pilLatestImageTime = time.time()
+                    if pilLatestImageOld is None or changes.isNearlySame(pilLatestImage):
+                        # Not worth fading
+                        pilLatestImageOld = pilLatestImage
+                        pilLatestImageTime -= fadeTime
+                    rendered = False
+                    
+                    if recorder is not None and mode == 'LWATV' and latest.lastModified != lastModified:
+                        lastModified = latest.lastModified
+                        recorder.addFrame(latestData, calendar.timegm(lastModified.timetuple()))
+                        
+                elif latestData is not None and (size[0] > decodeSize[0] or size[1] > decodeSize[1]):
+                    # Decode again for the larger panel
+                    decodeSize = size
+                    pilLatestImage = pilLatestImageOld = decodeForSize(latestData, decodeSize)
+                    
+                fading = fade and time.time()-pilLatestImageTime < fadeTime
+                if pilLatestImage is not None and size[0] > 0 and size[1] > 0 and (fading or not rendered or size != renderedSize):
+                    if fading:
+                        alpha = (time.time() - pilLatestImageTime)/fadeTime
+                        try:
+                            pilImage = PImage.blend(pilLatestImageOld, pilLatestImage, alpha)
+                        except ValueError:
+                            pilImage = pilLatestImage
+                    else:
+                        pilImage = pilLatestImage
+                    frames.write(mode, fitToPanel(pilImage, size))
+                    rendered, renderedSize = not fading, size
+                    
+            except Exception as e:
+                print("Error in fetcher: %s" % str(e))
+                if verbose:
+                    traceback.print_exc()
+                    
+            stopEvent.wait(0.2 if fade else 0.5)
+    finally:
+        if recorder is not None:
+            recorder.finish(wait=True)
+        if ledger is not None:
+            ledger.flush()
+        frames.close()
+
+
+class TextFitter(object):
+    """
+    Class to find the largest font size at which a block of text fits inside a
+    text box.  The wrapped text is measured with a device context and a binary
+    search over point sizes, and the results are cached by the text, the box
+    size, and the base font.
+    """
+    
+    def __init__(self, window, minSize=6, maxSize=96, cacheSize=64):
+        self.window = window
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.cacheSize = cacheSize
+        self._cache = {}
+        
+    def _fits(self, dc, text, width, height):
+        lineHeight = dc.GetCharHeight()
+        spaceWidth = dc.GetTextExtent(' ')[0]
+        
+        # Word wrap each paragraph the same way the text box does
+        nLines = 0
+        for paragraph in text.split('\n'):
+            nLines += 1
+            x = 0
+            for word in paragraph.split():
+                ww = dc.GetTextExtent(word)[0]
+                if x > 0 and x + spaceWidth + ww > width:
+                    nLines += 1
+                    x = ww
+                elif x > 0:
+                    x += spaceWidth + ww
+                else:
+                    x = ww
+            if nLines*lineHeight > height:
+                return False
+        return True
+        
+    def fit(self, text, size, font):
+        """
+        Return the point size to use for the text in a box of the given size.
+        """
+        
+        key = (text, tuple(size), font.GetNativeFontInfoDesc())
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+            
+        # Leave room for the border and the scroll bar
+        margin = 8
+        width = size[0] - 2*margin - wx.SystemSettings.GetMetric(wx.SYS_VSCROLL_X)
+        height = size[1] - 2*margin
+        
+        dc = wx.ClientDC(self.window)
+        font = wx.Font(font)
+        lo, hi = self.minSize, self.maxSize
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            font.SetPointSize(mid)
+            dc.SetFont(font)
+            if self._fits(dc, text, width, height):
+                lo = mid
+            else:
+                hi = mid - 1
+                
+        if len(self._cache) >= self.cacheSize:
+            self._cache.clear()
+        self._cache[key] = lo
+        return lo
+
+
+# Candidate video sinks and H.264 decoders for probeVideo(), in the order
+# they are tried - the sinks need to be able to draw into a wx window so full
+# screen ones like kmssink are left out
+VIDEO_SINKS = ['glimagesink', 'xvimagesink', 'ximagesink', 'osxvideosink']
+VIDEO_DECODERS = ['v4l2h264dec', 'omxh264dec', 'vah264dec', 'vaapih264dec', 'nvh264dec',
+                  'avdec_h264', 'openh264dec']
+
+
+def _runVideoProbe(description, nFrames, timeout):
+    """
+    Run a probe pipeline whose video sink is named 'sink' to completion and
+    return a dictionary of the fraction of frames dropped and the CPU used,
+    or None if the pipeline does not work.
+    """
+    
+    try:
+        pipeline = Gst.parse_launch(description)
+    except Exception:
+        return None
+    sink = pipeline.get_by_name('sink')
+    bus = pipeline.get_bus()
+    
+    tStart = time.time()
+    cStart = time.process_time()
+    pipeline.set_state(Gst.State.PLAYING)
+    message = bus.timed_pop_filtered(int(timeout*Gst.SECOND), Gst.MessageType.EOS|Gst.MessageType.ERROR)
+    tElapsed = time.time() - tStart
+    cElapsed = time.process_time() - cStart
+    
+    try:
+        stats = sink.get_property('stats')
+        rendered, dropped = stats.get_value('rendered'), stats.get_value('dropped')
+    except Exception:
+        rendered, dropped = nFrames, 0
+    pipeline.set_state(Gst.State.NULL)
+    
+    if message is None or message.type != Gst.MessageType.EOS or rendered == 0:
+        return None
+    return {'dropped': dropped/float(rendered+dropped), 'cpu': cElapsed/tElapsed}
+
+
+def _bestVideoProbe(results):
+    """
+    Return the name of the best entry in a dictionary of probe results, i.e.,
+    the one that uses the least CPU without dropping frames.
+    """
+    
+    working = [(r['dropped'] > 0.02, r['cpu'], r['dropped'], name) for name,r in results.items() if r is not None]
+    if len(working) == 0:
+        return None
+    return min(working)[-1]
+
+
+def probeVideo(width=640, height=360, fps=30, duration=1.5, verbose=False):
+    """
+    Find the fastest working video sink and H.264 decoder available by playing
+    short test clips through each of them.  The sinks are tried first with a
+    videotestsrc clip and then the decoders are tried with the best sink.
+    Sinks that cannot be embedded in a window with GstVideoOverlay are
+    skipped.
+    Returns a dictionary with the 'sink' and 'decoder' names, either of which
+    may be None if nothing suitable was found, and the individual results.
+    """
+    
+    initGStreamer()
+    
+    nFrames = int(fps*duration)
+    caps = 'video/x-raw,format=I420,width=%i,height=%i,framerate=%i/1' % (width, height, fps)
+    timeout = 4*duration + 5
+    
+    # Sinks
+    sinks = {}
+    for name in VIDEO_SINKS:
+        element = Gst.ElementFactory.make(name, None)
+        if element is None:
+            continue
+        if not isinstance(element, GstVideo.VideoOverlay):
+            if verbose:
+                print("Video sink %s: cannot be embedded in a window" % name)
+            continue
+        sinks[name] = _runVideoProbe('videotestsrc num-buffers=%i ! %s ! videoconvert ! %s name=sink sync=true' % (nFrames, caps, name),
+                                     nFrames, timeout)
+        if verbose:
+            print("Video sink %s: %s" % (name, sinks[name]))
+    sink = _bestVideoProbe(sinks)
+    
+    # Decoders - these need an H.264 clip to work with
+    decoders = {}
+    if sink is not None and Gst.ElementFactory.find('x264enc') is not None:
+        filename = os.path.join(tempfile.gettempdir(), 'lwatv-probe-%i.mov' % os.getpid())
+        try:
+            encode = Gst.parse_launch('videotestsrc num-buffers=%i ! %s ! x264enc speed-preset=ultrafast key-int-max=%i ! h264parse ! qtmux ! filesink location="%s"' % (nFrames, caps, fps, filename))
+            encode.set_state(Gst.State.PLAYING)
+            encode.get_bus().timed_pop_filtered(int(timeout*Gst.SECOND), Gst.MessageType.EOS|Gst.MessageType.ERROR)
+            encode.set_state(Gst.State.NULL)
+            
+            for name in VIDEO_DECODERS:
+                if Gst.ElementFactory.find(name) is None:
+                    continue
+                decoders[name] = _runVideoProbe('filesrc location="%s" ! qtdemux ! h264parse ! %s ! videoconvert ! %s name=sink sync=true' % (filename, name, sink),
+                                                nFrames, timeout)
+                if verbose:
+                    print("Video decoder %s: %s" % (name, decoders[name]))
+        finally:
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+    decoder = _bestVideoProbe(decoders)
+    
+    return {'sink': sink, 'decoder': decoder,
+            'sinks': sinks, 'decoders': decoders}
+
+
+def loadVideoConfig(filename):
+    """
+    Return the cached probeVideo() results in 'filename' or None if there are
+    none for this machine.
+    """
+    
+    try:
+        with open(filename, 'r') as fh:
+            config = json.load(fh)
+        # Results from another machine, or for a sink that is no longer a
+        # candidate, need to be redone
+        if config['host'] == platform.node() and config['sink'] in VIDEO_SINKS+[None]:
+            return config
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def getVideoConfig(filename, reprobe=False, verbose=False):
+    """
+    Return the video sink and decoder to use on this machine, running
+    probeVideo() and caching the results in 'filename' if needed.
+    """
+    
+    config = None
+    if not reprobe:
+        config = loadVideoConfig(filename)
+        
+    if config is None:
+        print("Probing for the best video sink and decoder, this may take a moment")
+        config = probeVideo(verbose=verbose)
+        config['host'] = platform.node()
+        try:
+            with open(filename+'.tmp', 'w') as fh:
+                json.dump(config, fh, indent=2)
+            os.replace(filename+'.tmp', filename)
+        except (IOError, OSError) as e:
+            print("Error saving video probe results: %s" % str(e))
+            
+    if verbose:
+        print("Using video sink %s and decoder %s" % (config['sink'], config['decoder']))
+    return config
+
+
+def runVideoProbe(filename, verbose=False):
+    """
+    Main function for the background process that probes for the best video
+    sink and decoder and saves the results to 'filename'.
+    """
+    
+    getVideoConfig(filename, reprobe=True, verbose=verbose)
+
+
+def readAhead(filename, chunkSize=1024**2):
+    """
+    Pull a file into the page cache ahead of when it is needed.
+    """
+    
+    try:
+        fh = open(filename, 'rb', buffering=0)
+    except (IOError, OSError):
+        return
+        
+    try:
+        # Ask the kernel to start reading...
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            
+        # ... and then make sure it all got read
+        buf = bytearray(chunkSize)
+        while fh.readinto(buf):
+            pass
+    except (IOError, OSError):
+        pass
+    finally:
+        fh.close()
+
+
+class MoviePlaylist(object):
+    """
+    Class to shuffle through the movies in the cache without repeats.  Every
+    movie is played once, in a random order, before any movie is played again.
+    Movies that show up part way through a shuffle are slotted in at random
+    and the next movie is read into the page cache while the current one plays.
+    """
+    
+    def __init__(self, moviePath, verbose=False):
+        self.moviePath = moviePath
+        self.verbose = verbose
+        
+        self.queue = []
+        self.bag = set()
+        self.last = None
+        
+    def next(self, exclude=()):
+        """
+        Return the next movie to play, skipping over anything in 'exclude', or
+        None if there is nothing to play.
+        """
+        
+        movies = glob.glob(os.path.join(self.moviePath, '*.mov'))
+        movies = [movie for movie in movies if movie not in exclude]
+        
+        # Forget movies that have gone away and add any new ones
+        self.queue = [movie for movie in self.queue if movie in movies]
+        for movie in movies:
+            if movie not in self.bag:
+                self.queue.insert(random.randint(0, len(self.queue)), movie)
+                self.bag.add(movie)
+                
+        # Start a new shuffle, if needed, without repeating the last movie
+        if len(self.queue) == 0:
+            self.queue = list(movies)
+            random.shuffle(self.queue)
+            if len(self.queue) > 1 and self.queue[0] == self.last:
+                self.queue.append(self.queue.pop(0))
+            self.bag = set(self.queue)
+            
+        if len(self.queue) == 0:
+            return None
+        self.last = self.queue.pop(0)
+        return self.last
+        
+    def prefetch(self):
+        """
+        Read the movie that is up next into the page cache in the background.
+        """
+        
+        if len(self.queue) == 0:
+            return
+            
+        if self.verbose:
+            print("Reading ahead %s" % self.queue[0])
+        reader = threading.Thread(target=readAhead, args=(self.queue[0],))
+        reader.daemon = True
+        reader.start()
+
+
+class MoviePipeline(object):
+    """
+    Class to play movies with a GStreamer playbin that renders into the window
+    with the handle 'windowHandle'.  Events are passed on to 'listener', which
+    needs on_movie_eos(), on_movie_error(), on_movie_playing(), and
+    on_movie_telemetry(summary) methods.  This is used directly by MoviePlayer
+    and by the movie process used by --isolate-movies.
+    
+    Based on:
+        Example 2.2 http://pygstdocs.berlios.de/pygst-tutorial/playbin.html
+    """
+    
+    def __init__(self, windowHandle, listener, verbose=False, videoSink=None, videoDecoder=None):
+        initGStreamer()
+        
+        self.windowHandle = windowHandle
+        self.listener = listener
+        self.verbose = verbose
+        
+        self.pipeline = Gst.Pipeline()
+        self.player = Gst.ElementFactory.make("playbin", None)
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.enable_sync_message_emission()
+        bus.connect('message::eos', self.on_eos_message)
+        bus.connect('message::error', self.on_error_message)
+        bus.connect('message::qos', self.on_qos_message)
+        bus.connect('message::buffering', self.on_buffering_message)
+        bus.connect('message::latency', self.on_latency_message)
+        bus.connect('message::state-changed', self.on_state_changed_message)
+        bus.connect('sync-message::element', self.on_sync_message)
+        self.pipeline.add(self.player)
+        
+        # Use the sink and decoder picked by probeVideo(), if any
+        if videoSink not in (None, 'auto'):
+            vs = Gst.ElementFactory.make(videoSink, None)
+            if vs is not None:
+                self.player.set_property("video-sink", vs)
+        if videoDecoder not in (None, 'auto'):
+            factory = Gst.ElementFactory.find(videoDecoder)
+            if factory is not None:
+                factory.set_rank(Gst.Rank.PRIMARY + 1)
+                
+        # Playback telemetry for the movie that is playing
+        self.telemetry = None
+        
+        # Whether or not the movie is being streamed and, if so, whether it
+        # is paused to let the buffer fill
+        self.streaming = False
+        self.buffering = False
+        
+    def on_eos_message(self, bus, message):
+        if self.verbose:
+            print("Finished movie")
+        self.stop()
+        self.listener.on_movie_eos()
+        
+    def on_error_message(self, bus, message):
+        err, debug = message.parse_error()
+        print("Error %s: %s" % (err, debug))
+        
+        self.stop()
+        self.listener.on_movie_error()
+        
+    def on_qos_message(self, bus, message):
+        if self.telemetry is None:
+            return
+            
+        # Only keep track of what the video sink reports
+        if not message.src.has_as_ancestor(self.player) or message.src.find_property('stats') is None:
+            return
+        fmt, processed, dropped = message.parse_qos_stats()
+        jitter, proportion, quality = message.parse_qos_values()
+        self.telemetry['processed'] = processed
+        self.telemetry['dropped'] = dropped
+        self.telemetry['jitterSum'] += abs(jitter)/1e6
+        self.telemetry['jitterMax'] = max([self.telemetry['jitterMax'], abs(jitter)/1e6])
+        self.telemetry['nQoS'] += 1
+        
+    def on_buffering_message(self, bus, message):
+        percent = message.parse_buffering()
+        
+        # Hold a stream while the buffer fills so that it does not underrun
+        if self.streaming:
+            if percent < 100 and not self.buffering:
+                if self.verbose:
+                    print("Buffering stream")
+                self.buffering = True
+                self.pipeline.set_state(Gst.State.PAUSED)
+            elif percent == 100 and self.buffering:
+                if self.verbose:
+                    print("Resuming stream")
+                self.buffering = False
+                self.pipeline.set_state(Gst.State.PLAYING)
+                
+        if self.telemetry is None:
+            return
+            
+        if percent < 100 and self.telemetry['tBuffering'] is None:
+            self.telemetry['buffering'] += 1
+            self.telemetry['tBuffering'] = time.time()
+        elif percent == 100 and self.telemetry['tBuffering'] is not None:
+            self.telemetry['bufferingTime'] += time.time() - self.telemetry['tBuffering']
+            self.telemetry['tBuffering'] = None
+            
+    def on_latency_message(self, bus, message):
+        # Something in the pipeline changed its latency, redistribute it
+        self.pipeline.recalculate_latency()
+        if self.telemetry is not None:
+            self.telemetry['latency'] += 1
+            
+    def on_state_changed_message(self, bus, message):
+        if message.src != self.pipeline:
+            return
+        old, new, pending = message.parse_state_changed()
+        
+        if new == Gst.State.PLAYING:
+            self.listener.on_movie_playing()
+            
+        if self.telemetry is None:
+            return
+            
+        # The sink has prerolled (shown the first frame) once the pipeline
+        # reaches PAUSED
+        if new == Gst.State.PAUSED and self.telemetry['firstFrame'] is None:
+            self.telemetry['firstFrame'] = time.time() - self.telemetry['tStart']
+            if self.verbose:
+                print("First frame after %.3f s" % self.telemetry['firstFrame'])
+                
+    def on_sync_message(self, bus, message):
+        if message.get_structure().get_name() == 'prepare-window-handle':
+            if message.src.find_property('force-aspect-ratio') is not None:
+                message.src.set_property('force-aspect-ratio', True)
+            message.src.set_window_handle(self.windowHandle)
+            
+    def _get_sink_stats(self):
+        # Find the actual video sink, which may be inside of an autovideosink,
+        # and return its rendered and dropped frame counts
+        sink = self.player.get_property('video-sink')
+        if sink is not None and sink.find_property('stats') is None and isinstance(sink, Gst.Bin):
+            result, child = sink.iterate_sinks().next()
+            sink = child if result == Gst.IteratorResult.OK else None
+        if sink is None or sink.find_property('stats') is None:
+            return None
+            
+        stats = sink.get_property('stats')
+        return stats.get_value('rendered'), stats.get_value('dropped')
+        
+    def finish_telemetry(self):
+        if self.telemetry is None:
+            return
+        telemetry, self.telemetry = self.telemetry, None
+        
+        # The sink's own counters are the most complete; fall back to the
+        # last QoS message if they are not available
+        try:
+            stats = self._get_sink_stats()
+        except Exception:
+            stats = None
+        if stats is None:
+            stats = (telemetry['processed'], telemetry['dropped'])
+        telemetry['rendered'], telemetry['dropped'] = stats
+        
+        for key in ('tStart', 'tBuffering', 'processed'):
+            del telemetry[key]
+        self.listener.on_movie_telemetry(telemetry)
+        
+    def is_playing(self):
+        if self.buffering:
+            return True
+        for state in self.pipeline.get_state(0):
+            if type(state) != type(Gst.State.PLAYING):
+                continue
+            if state == Gst.State.PLAYING:
+                return True
+        return False
+        
+    def play(self, movie):
+        """
+        Play 'movie', which can either be a filename or a URL to stream.
+        """
+        
+        self.stop()
+        self.streaming = movie.find('://') != -1
+        self.player.set_property('uri', movie if self.streaming else "file://%s" % movie)
+        self.telemetry = {'movie': os.path.basename(movie), 'tStart': time.time(),
+                          'firstFrame': None, 'processed': 0, 'dropped': 0,
+                          'jitterSum': 0.0, 'jitterMax': 0.0, 'nQoS': 0,
+                          'buffering': 0, 'bufferingTime': 0.0, 'tBuffering': None,
+                          'latency': 0}
+        self.pipeline.set_state(Gst.State.PLAYING)
+        
+    def stop(self):
+        self.finish_telemetry()
+        self.pipeline.set_state(Gst.State.NULL)
+        self.streaming = self.buffering = False
+        
+    def close(self):
+        self.stop()
+
+
+class _PipeListener(object):
+    """
+    MoviePipeline listener that passes the events on to the GUI over a pipe.
+    """
+    
+    def __init__(self, conn):
+        self.conn = conn
+        
+    def _send(self, *message):
+        try:
+            self.conn.send(message)
+        except (IOError, OSError):
+            pass
+            
+    def on_movie_eos(self):
+        self._send('on_movie_eos')
+        
+    def on_movie_error(self):
+        self._send('on_movie_error')
+        
+    def on_movie_playing(self):
+        self._send('on_movie_playing')
+        
+    def on_movie_telemetry(self, summary):
+        self._send('on_movie_telemetry', summary)
+
+
+def runMoviePipeline(conn, windowHandle, verbose=False, videoSink=None, videoDecoder=None):
+    """
+    Main loop for the movie process used by --isolate-movies.  This plays the
+    movies into the movie panel's window with its own GStreamer pipeline so
+    that the video keeps going when the GUI is busy.  Commands are read from
+    'conn' and events are sent back over it.
+    """
+    
+    initX11Threads()
+    initGStreamer()
+    from gi.repository import GLib
+    
+    loop = GLib.MainLoop()
+    pipeline = MoviePipeline(windowHandle, _PipeListener(conn), verbose=verbose,
+                             videoSink=videoSink, videoDecoder=videoDecoder)
+                             
+    def on_command(fd, condition):
+        try:
+            command = conn.recv()
+        except (EOFError, IOError, OSError):
+            # The GUI has gone away
+            loop.quit()
+            return False
+            
+        if command[0] == 'play':
+            pipeline.play(command[1])
+        elif command[0] == 'stop':
+            pipeline.stop()
+        elif command[0] == 'quit':
+            loop.quit()
+            return False
+        return True
+        
+    GLib.io_add_watch(conn.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN|GLib.IO_HUP|GLib.IO_ERR, on_command)
+    try:
+        loop.run()
+    finally:
+        pipeline.close()
+        conn.close()
+
+
+class MovieProcess(object):
+    """
+    Class that stands in for a MoviePipeline but plays the movies in a separate
+    process with runMoviePipeline().  Events from that process are passed on
+    to 'listener' from poll(), which should be called regularly.  If the
+    process dies it is restarted for the next movie, and the movie that was
+    playing at the time is reported as an error.
+    """
+    
+    def __init__(self, windowHandle, listener, verbose=False, videoSink=None, videoDecoder=None):
+        self.windowHandle = windowHandle
+        self.listener = listener
+        self.verbose = verbose
+        self.videoSink = videoSink
+        self.videoDecoder = videoDecoder
+        
+        self.process = None
+        self.conn = None
+        self.playing = False
+        self.restarts = 0
+        self.start()
+        
+    def start(self):
+        ctx = get_context('spawn')
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=runMoviePipeline,
+                                   args=(child, self.windowHandle, self.verbose,
+                                         self.videoSink, self.videoDecoder),
+                                   daemon=True)
+        self.process.start()
+        child.close()
+        if self.verbose:
+            print("Started movie process with PID %i" % self.process.pid)
+            
+    def _send(self, *command):
+        try:
+            self.conn.send(command)
+        except (IOError, OSError):
+            # poll() will take care of it
+            pass
+            
+    def is_playing(self):
+        return self.playing
+        
+    def play(self, movie):
+        if self.process is None:
+            self.restarts += 1
+            self.start()
+        self._send('play', movie)
+        self.playing = True
+        
+    def stop(self):
+        if self.process is not None and self.playing:
+            self._send('stop')
+        self.playing = False
+        
+    def poll(self):
+        if self.process is None:
+            return
+            
+        try:
+            while self.conn.poll():
+                message = self.conn.recv()
+                if message[0] in ('on_movie_eos', 'on_movie_error'):
+                    self.playing = False
+                if message[0] in ('on_movie_eos', 'on_movie_error', 'on_movie_playing', 'on_movie_telemetry'):
+                    getattr(self.listener, message[0])(*message[1:])
+        except (EOFError, IOError, OSError):
+            pass
+            
+        # Wait to restart the process until the next movie so that the
+        # listener's back off also applies to restarts
+        if not self.process.is_alive():
+            print("Movie process exited with code %s" % self.process.exitcode)
+            self.conn.close()
+            self.process = None
+            if self.playing:
+                self.playing = False
+                self.listener.on_movie_error()
+                
+    def close(self):
+        if self.process is None:
+            return
+            
+        self._send('quit')
+        self.process.join(2)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+
+
+class MoviePlayer(wx.Panel):
+    """
+    wx.Panel object to deal with playing the old movies.  If 'isolate' is True
+    the movies are played in a separate process with MovieProcess, otherwise a
+    MoviePipeline is used.  If 'movieURL' is given it is called to get the
+    URL of the newest movie so that it can be streamed while updateMovies.py
+    is still downloading it.
+    """
+    
+    def __init__(self, parent, moviePath, label, verbose=False, maxFailures=2, maxBackoff=300.0, videoSink=None, videoDecoder=None, isolate=False, movieURL=None):
+        super(MoviePlayer, self).__init__(parent, -1, style=wx.EXPAND)
+        
+        self.moviePath = moviePath
+        self.label = label
+        self.verbose = verbose
+        self.videoSink = videoSink
+        self.videoDecoder = videoDecoder
+        self.isolate = isolate
+        self.movieURL = movieURL
+        self.streamed = set()
+        self.SetBackgroundColour(wx.BLACK)
+        self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
+        self.Bind(wx.EVT_PAINT, self.on_paint)
+        
+        # Error tracking - movies that fail 'maxFailures' times are quarantined
+        # until the file changes and retries back off up to 'maxBackoff' s
+        self.maxFailures = maxFailures
+        self.maxBackoff = maxBackoff
+        self.movie = None
+        self.failures = {}
+        self.quarantine = {}
+        self.errorStreak = 0
+        self.retry = None
+        self.placeholder = False
+        self.poster = None
+        self.playlist = MoviePlaylist(moviePath, verbose=verbose)
+        
+        # Playback telemetry - 'playback' holds the totals for each movie
+        self.playback = {}
+        
+        # The pipeline is built on the first call to update() and rebuilt for
+        # the next movie if the video sink or decoder change
+        self.pipeline = None
+        self.rebuild = False
+        
+        # Events from the movie process are picked up with a timer
+        self.timer = None
+        if self.isolate:
+            self.timer = wx.Timer(self)
+            self.Bind(wx.EVT_TIMER, self.on_timer, self.timer)
+            
+    def init_pipeline(self):
+        if self.isolate:
+            self.pipeline = MovieProcess(self.GetHandle(), self, verbose=self.verbose,
+                                         videoSink=self.videoSink, videoDecoder=self.videoDecoder)
+            self.timer.Start(200)
+        else:
+            self.pipeline = MoviePipeline(self.GetHandle(), self, verbose=self.verbose,
+                                          videoSink=self.videoSink, videoDecoder=self.videoDecoder)
+                                          
+    def on_timer(self, event):
+        self.pipeline.poll()
+        
+    def set_video(self, videoSink, videoDecoder):
+        """
+        Switch to a different video sink and decoder, starting with the next
+        movie.
+        """
+        
+        self.videoSink = videoSink
+        self.videoDecoder = videoDecoder
+        self.rebuild = self.pipeline is not None
+        
+    def on_movie_eos(self):
+        self.errorStreak = 0
+        
+        self.update()
+        
+    def on_movie_error(self):
+        if self.movie is not None:
+            self.record_failure(self.movie)
+        wx.CallAfter(self.schedule_update)
+        
+    def on_movie_playing(self):
+        # The video sink takes over from the poster once the movie is playing
+        self.poster = None
+        
+    def on_movie_telemetry(self, summary):
+        entry = self.playback.setdefault(summary['movie'], {'plays': 0, 'rendered': 0, 'dropped': 0,
+                                                            'jitterSum': 0.0, 'jitterMax': 0.0, 'nQoS': 0,
+                                                            'firstFrameSum': 0.0, 'nFirstFrame': 0,
+                                                            'buffering': 0, 'bufferingTime': 0.0,
+                                                            'latency': 0})
+        entry['plays'] += 1
+        entry['rendered'] += summary['rendered']
+        entry['dropped'] += summary['dropped']
+        entry['jitterSum'] += summary['jitterSum']
+        entry['jitterMax'] = max([entry['jitterMax'], summary['jitterMax']])
+        entry['nQoS'] += summary['nQoS']
+        if summary['firstFrame'] is not None:
+            entry['firstFrameSum'] += summary['firstFrame']
+            entry['nFirstFrame'] += 1
+        entry['buffering'] += summary['buffering']
+        entry['bufferingTime'] += summary['bufferingTime']
+        entry['latency'] += summary['latency']
+        if self.verbose:
+            print("Played %s: %i frames rendered, %i dropped, %.1f ms max. jitter" % (summary['movie'], summary['rendered'], summary['dropped'], summary['jitterMax']))
+            
+    def get_playback_stats(self):
+        """
+        Return a dictionary of the playback QoS statistics for each movie.
+        """
+        
+        stats = {}
+        for movie,entry in self.playback.items():
+            total = entry['rendered'] + entry['dropped']
+            stats[movie] = {'plays': entry['plays'],
+                            'rendered': entry['rendered'],
+                            'dropped': entry['dropped'],
+                            'dropRate': entry['dropped']/float(total) if total else 0.0,
+                            'meanJitter': entry['jitterSum']/entry['nQoS'] if entry['nQoS'] else 0.0,
+                            'maxJitter': entry['jitterMax'],
+                            'timeToFirstFrame': entry['firstFrameSum']/entry['nFirstFrame'] if entry['nFirstFrame'] else None,
+                            'buffering': entry['buffering'],
+                            'bufferingTime': entry['bufferingTime'],
+                            'latencyChanges': entry['latency']}
+        return stats
+        
+    def on_paint(self, event):
+        dc = wx.PaintDC(self)
+        if self.placeholder:
+            dc.SetBackground(wx.BLACK_BRUSH)
+            dc.Clear()
+            dc.SetTextForeground(wx.WHITE)
+            text = "No movies available"
+            w, h = self.GetSize()
+            tw, th = dc.GetTextExtent(text)
+            dc.DrawText(text, (w-tw)//2, (h-th)//2)
+        elif self.poster is not None:
+            # Show the poster frame until the movie starts playing
+            dc.SetBackground(wx.BLACK_BRUSH)
+            dc.Clear()
+            w, h = self.GetSize()
+            wi, hi = self.poster.GetSize()
+            s = min([1.0*w/wi, 1.0*h/hi])
+            wi, hi = int(round(wi*s)), int(round(hi*s))
+            if wi > 0 and hi > 0:
+                bitmap = Bitmap(self.poster.Scale(wi, hi, wx.IMAGE_QUALITY_NORMAL))
+                dc.DrawBitmap(bitmap, (w-wi)//2, (h-hi)//2)
+                
+    def load_poster(self, movie):
+        # Poster frames are made by updateMovies.py
+        poster = os.path.splitext(movie)[0]+'.jpg'
+        self.poster = None
+        if os.path.exists(poster):
+            image = wx.Image(poster, wx.BITMAP_TYPE_JPEG)
+            if image.IsOk():
+                self.poster = image
+        self.Refresh()
+        
+    def _signature(self, movie):
+        try:
+            st = os.stat(movie)
+            return (st.st_size, st.st_mtime)
+        except OSError:
+            return None
+            
+    def record_failure(self, movie):
+        self.errorStreak += 1
+        self.failures[movie] = self.failures.get(movie, 0) + 1
+        if self.failures[movie] >= self.maxFailures and movie not in self.quarantine:
+            print("Quarantining %s after %i failures" % (os.path.basename(movie), self.failures[movie]))
+            self.quarantine[movie] = self._signature(movie)
+            
+    def schedule_update(self):
+        # Back off exponentially if things keep failing
+        if self.retry is not None and self.retry.IsRunning():
+            return
+        delay = min([2**max([self.errorStreak-1, 0]), self.maxBackoff])
+        if self.verbose:
+            print("Trying another movie in %.0f s" % delay)
+        self.retry = wx.CallLater(int(delay*1000), self.update)
+        
+    def record_play(self, movie):
+        # Keep track of how many times each movie has been played so that
+        # updateMovies.py can evict the most played movies first
+        filename = os.path.join(self.moviePath, 'playcounts.json')
+        try:
+            with open(filename, 'r') as fh:
+                counts = json.load(fh)
+        except (IOError, OSError, ValueError):
+            counts = {}
+            
+        movieBase = os.path.basename(movie)
+        counts[movieBase] = counts.get(movieBase, 0) + 1
+        counts = dict((m,c) for m,c in counts.items() if os.path.exists(os.path.join(self.moviePath, m)))
+        try:
+            with open(filename+'.tmp', 'w') as fh:
+                json.dump(counts, fh)
+            os.replace(filename+'.tmp', filename)
+        except (IOError, OSError) as e:
+            print("Error updating play counts: %s" % str(e))
+            
+    def get_stats(self):
+        """
+        Return a dictionary of playback statistics, including the failure
+        counts, which movies are quarantined, and the per-movie QoS.
+        """
+        
+        return {'current': os.path.basename(self.movie) if self.movie else None,
+                'failures': dict((os.path.basename(m), c) for m,c in self.failures.items()),
+                'quarantined': sorted(os.path.basename(m) for m in self.quarantine),
+                'errorStreak': self.errorStreak,
+                'processRestarts': self.pipeline.restarts if self.isolate and self.pipeline is not None else None,
+                'playback': self.get_playback_stats()}
+                
+    def get_stream(self, maxAge=300):
+        # updateMovies.py downloads to a '.part' file so one for a past day
+        # that is still being written to and that is newer than any of the
+        # complete movies is the newest movie being downloaded; stream it
+        # once while that happens
+        if self.movieURL is None:
+            return None
+        tNow = time.time()
+        mjdNow = int(tNow/86400.0 + 2440587.5 - 2400000.5)
+        parts = []
+        for part in glob.glob(os.path.join(self.moviePath, '*.mov.part')):
+            try:
+                mjd = int(os.path.basename(part).split('.', 1)[0])
+                age = tNow - os.path.getmtime(part)
+            except (ValueError, OSError):
+                continue
+            if mjd < mjdNow and age < maxAge:
+                parts.append(part)
+        if len(parts) == 0:
+            return None
+        movieBase = os.path.basename(max(parts))[:-5]
+        
+        movies = glob.glob(os.path.join(self.moviePath, '*.mov'))
+        if len(movies) > 0 and os.path.basename(max(movies)) >= movieBase:
+            return None
+        if movieBase in self.streamed:
+            return None
+        self.streamed.add(movieBase)
+        return self.movieURL(movieBase)
+        
+    def get_movie(self):
+        # Start with the newest movie if it is still downloading
+        movie = self.get_stream()
+        if movie is not None:
+            if self.verbose:
+                print("Streaming %s" % movie)
+            return movie
+            
+        # Skip over quarantined movies unless they have been replaced
+        for movie in list(self.quarantine.keys()):
+            if self._signature(movie) != self.quarantine[movie]:
+                del self.quarantine[movie]
+                self.failures.pop(movie, None)
+        movie = self.playlist.next(exclude=self.quarantine)
+        if movie is None:
+            return None
+            
+        if self.verbose:
+            print("Next movie is %s" % movie)
+        return movie
+        
+    def update(self):
+        if self.pipeline is None:
+            self.init_pipeline()
+            
+        if not self.pipeline.is_playing():
+            movie = self.get_movie()
+            if movie is None:
+                # Nothing to play, show the placeholder and check again later
+                self.pipeline.stop()
+                self.movie = None
+                self.errorStreak += 1
+                self.poster = None
+                if not self.placeholder:
+                    self.placeholder = True
+                    self.label.SetLabel("Previous Movies")
+                    self.Refresh()
+                self.schedule_update()
+                return
+            self.placeholder = False
+            self.movie = movie
+            
+            if self.rebuild:
+                self.pipeline.close()
+                self.init_pipeline()
+                self.rebuild = False
+            
+            movieBase = os.path.basename(movie)
+            mjd = int(movieBase.split('.', 1)[0])
+            jd = mjd + 2400000.5
+            t = (jd - 2440587.5)*86400.0
+            dt = datetime.utcfromtimestamp(t)
+            mn = dt.strftime("%B")
+            dy = int(dt.strftime("%d"))
+            yr = int(dt.strftime("%Y"))
+            datestr = "%s %i, %i" % (mn, dy, yr)
+            self.label.SetLabel("Movie for %s" % datestr)		
+            
+            self.pipeline.stop()
+            self.load_poster(movie)
+            self.pipeline.play(movie)
+            
+            self.record_play(movie)
+            
+            # Get the next one ready while this one plays
+            self.playlist.prefetch()
+            
+    def stop(self):
+        if self.retry is not None:
+            self.retry.Stop()
+        if self.timer is not None:
+            self.timer.Stop()
+        if self.pipeline is not None:
+            self.pipeline.close()
+
+
+class RenderGovernor(object):
+    """
+    Class to keep the time spent drawing the latest image within a per-frame
+    and/or CPU budget.  The governor steps down a ladder of fade frame rates,
+    fade durations, and scaling qualities when the budget is exceeded and
+    back up when there is plenty of headroom.
+    """
+    
+    # Fade timer interval in ms, fraction of the configured fade time, and the
+    # scaling quality for each level.  Level 1 is the default.
+    LEVELS = [(200, 1.0, wx.IMAGE_QUALITY_HIGH),
+              (200, 1.0, wx.IMAGE_QUALITY_NORMAL),
+              (333, 1.0, wx.IMAGE_QUALITY_NORMAL),
+              (500, 0.5, wx.IMAGE_QUALITY_NORMAL),
+              (1000, 0.0, wx.IMAGE_QUALITY_NORMAL)]
+              
+    def __init__(self, frameBudget=0.0, cpuBudget=0.0, level=1, window=2.0, holdOff=10.0):
+        self.frameBudget = frameBudget
+        self.cpuBudget = cpuBudget
+        self.level = level
+        self.window = window
+        self.holdOff = holdOff
+        
+        self.renderTime = 0.0
+        self.cpu = 0.0
+        self.windowStart = time.time()
+        self.cpuStart = time.process_time()
+        self.lastChange = self.windowStart
+        
+    def record(self, renderTime):
+        """
+        Record how long it took to render a frame.
+        """
+        
+        self.renderTime = 0.8*self.renderTime + 0.2*renderTime
+        
+    def evaluate(self):
+        """
+        Update the CPU usage and move between levels if needed.  Returns True
+        if the level changed.
+        """
+        
+        tNow = time.time()
+        if tNow - self.windowStart < self.window:
+            return False
+            
+        # CPU usage of the whole process over the last window
+        cpuNow = time.process_time()
+        self.cpu = (cpuNow - self.cpuStart)/(tNow - self.windowStart)
+        self.windowStart, self.cpuStart = tNow, cpuNow
+        
+        over = (self.frameBudget > 0 and self.renderTime > self.frameBudget) \
+               or (self.cpuBudget > 0 and self.cpu > self.cpuBudget)
+        under = (self.frameBudget <= 0 or self.renderTime < 0.5*self.frameBudget) \
+                and (self.cpuBudget <= 0 or self.cpu < 0.5*self.cpuBudget)
+                
+        if over and self.level < len(self.LEVELS)-1:
+            self.level += 1
+        elif under and self.level > 0 and tNow - self.lastChange > self.holdOff:
+            self.level -= 1
+        else:
+            return False
+        self.lastChange = tNow
+        return True
+        
+    def getSettings(self):
+        return self.LEVELS[self.level]
+
+
+class TimeLapsePlayer(wx.Panel):
     """
-    wx.Panel object to deal with playing the old movies.
-    
-    Based on:
-        Example 2.2 http://pygstdocs.berlios.de/pygst-tutorial/playbin.html
+    wx.Panel object to loop through the frames in a FrameRing in place of the
+    old movies.
     """
     
-    def __init__(self, parent, moviePath, label, verbose=False):
-        super(MoviePlayer, self).__init__(parent, -1, style=wx.EXPAND)
+    def __init__(self, parent, ring, label, fps=10, verbose=False):
+        super(TimeLapsePlayer, self).__init__(parent, -1, style=wx.EXPAND)
         
-        self.moviePath = moviePath
+        self.ring = ring
         self.label = label
+        self.fps = fps
         self.verbose = verbose
         self.SetBackgroundColour(wx.BLACK)
         self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
         
-        self.pipeline = Gst.Pipeline()
-        self.player = Gst.ElementFactory.make("playbin", None)
+        self.index = 0
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_timer, self.timer)
+        
+    def on_timer(self, event):
+        n = len(self.ring)
+        if n == 0:
+            return
+            
+        if self.index >= n:
+            self.index = 0
+        if self.index == 0:
+            self.label.SetLabel("Time-Lapse of the Last %i Minutes" % round(self.ring.getSpan()/60.0))
+            
+        drawFitted(pilToWx(self.ring.get(self.index)), self)
+        self.index += 1
+        
+    def update(self):
+        if not self.timer.IsRunning():
+            self.timer.Start(int(1000/self.fps))
+            
+    def stop(self):
+        self.timer.Stop()
+
+
+class CompositorRenderer(object):
+    """
+    Class to show the latest image with a GStreamer appsrc -> compositor ->
+    videoscale -> video sink pipeline that renders into the latest image panel.
+    The outgoing and incoming images are pushed into their own appsrc and the
+    cross-fade is done by changing the alpha of the incoming compositor pad so
+    that the blending and scaling happen outside of Python.
+    """
+    
+    def __init__(self, panel, fadeTime, fps=20, verbose=False, videoSink=None):
+        initGStreamer()
+        
+        if videoSink in (None, 'auto'):
+            videoSink = 'autovideosink'
+        self.panel = panel
+        self.fadeTime = fadeTime
+        self.verbose = verbose
+        
+        src = 'appsrc name=src%i is-live=true format=time do-timestamp=true ! videoconvert ! comp.sink_%i'
+        self.pipeline = Gst.parse_launch(' '.join(['compositor name=comp background=black start-time-selection=first',
+                                                   '! video/x-raw,framerate=%i/1 ! videoconvert' % fps,
+                                                   '! videoscale add-borders=true ! capsfilter name=size',
+                                                   '! videoconvert ! %s sync=false' % videoSink,
+                                                   src % (0, 0), src % (1, 1)]))
+        self.srcs = [self.pipeline.get_by_name('src%i' % i) for i in (0, 1)]
+        comp = self.pipeline.get_by_name('comp')
+        self.pads = [comp.get_static_pad('sink_%i' % i) for i in (0, 1)]
+        self.size = self.pipeline.get_by_name('size')
+        
         bus = self.pipeline.get_bus()
         bus.add_signal_watch()
         bus.enable_sync_message_emission()
-        bus.connect('message::eos', self.on_eos_message)
         bus.connect('message::error', self.on_error_message)
         bus.connect('sync-message::element', self.on_sync_message)
-        self.pipeline.add(self.player)
-        if sys.platform == 'darwin':
-            vs = Gst.ElementFactory.make("ximagesink", None)
-            self.player.set_property("video-sink", vs)
-            
-    def on_eos_message(self, bus, message):
-        if self.verbose:
-            print("Finished movie")
-        self.pipeline.set_state(Gst.State.NULL)
         
-        self.update()
+        self.sink = None
+        self.shown = None
+        self.current = None
+        self.panelSize = None
+        self.fadeStart = None
+        self.playing = False
         
     def on_error_message(self, bus, message):
         err, debug = message.parse_error()
         print("Error %s: %s" % (err, debug))
         
-        self.pipeline.set_state(Gst.State.NULL)
-        wx.CallAfter(self.update)
-        
     def on_sync_message(self, bus, message):
         if message.get_structure().get_name() == 'prepare-window-handle':
-            message.src.set_property('force-aspect-ratio', True)
-            message.src.set_window_handle(self.GetHandle())
+            self.sink = message.src
+            self.sink.set_window_handle(self.panel.GetHandle())
             
-    def get_movie(self):
-        movies = glob.glob(os.path.join(self.moviePath, '*.mov'))
-        movies.sort()
-        movie = random.choice(movies)
+    def _push(self, src, image):
+        # RGBA keeps the rows aligned the way GStreamer expects
+        image = image.convert('RGBA')
+        caps = 'video/x-raw,format=RGBA,width=%i,height=%i,framerate=0/1' % image.size
+        src.set_property('caps', Gst.Caps.from_string(caps))
+        src.emit('push-buffer', Gst.Buffer.new_wrapped(image.tobytes()))
         
-        if self.verbose:
-            print("Next movie is %s" % movie)
-        return movie
+    def show(self, image, fade=False, remember=True):
+        """
+        Show a new PIL image, optionally fading to it from the last image.  If
+        'remember' is True the image is also the one restored by redraw().
+        """
         
-    def update(self):
-        isPlaying = False
-        for state in self.pipeline.get_state(0):
-            if type(state) != type(Gst.State.PLAYING):
-                continue
-            if state == Gst.State.PLAYING:
-                isPlaying = True
-                break
-                
-        if not isPlaying:
-            movie = self.get_movie()
-            movieBase = os.path.basename(movie)
-            mjd = int(movieBase.split('.', 1)[0])
-            jd = mjd + 2400000.5
-            t = (jd - 2440587.5)*86400.0
-            dt = datetime.utcfromtimestamp(t)
-            mn = dt.strftime("%B")
-            dy = int(dt.strftime("%d"))
-            yr = int(dt.strftime("%Y"))
-            datestr = "%s %i, %i" % (mn, dy, yr)
-            self.label.SetLabel("Movie for %s" % datestr)		
+        old = self.shown if self.shown is not None else image
+        for pad in self.pads:
+            pad.set_property('width', image.size[0])
+            pad.set_property('height', image.size[1])
+        self._push(self.srcs[0], old)
+        self._push(self.srcs[1], image)
+        self.pads[1].set_property('alpha', 0.0 if fade else 1.0)
+        self.fadeStart = time.time() if fade else None
+        
+        self.shown = image
+        if remember:
+            self.current = image
             
-            self.pipeline.set_state(Gst.State.NULL)
-            self.player.set_property('uri', "file://%s" % movie)
+        if not self.playing:
+            self.tick()
             self.pipeline.set_state(Gst.State.PLAYING)
+            self.playing = True
+            
+    def redraw(self):
+        if self.current is not None:
+            self.show(self.current)
+            
+    def tick(self):
+        """
+        Follow the size of the panel and advance the fade.
+        """
+        
+        size = tuple(self.panel.GetSize())
+        if size != self.panelSize and size[0] > 0 and size[1] > 0:
+            caps = 'video/x-raw,width=%i,height=%i,pixel-aspect-ratio=1/1' % size
+            self.size.set_property('caps', Gst.Caps.from_string(caps))
+            self.panelSize = size
+            
+        if self.fadeStart is not None:
+            alpha = (time.time() - self.fadeStart)/self.fadeTime
+            if alpha >= 1.0:
+                alpha = 1.0
+                self.fadeStart = None
+            self.pads[1].set_property('alpha', alpha)
+            
+    def expose(self):
+        if self.sink is not None:
+            self.sink.expose()
             
     def stop(self):
         self.pipeline.set_state(Gst.State.NULL)
 
 
+class SamplingProfiler(object):
+    """
+    Class to sample the stack of the main thread from a background thread for
+    'duration' seconds and then write a report of where the time went to
+    'filename'.  'getStage' is an optional function that returns what the
+    application is doing so that the samples can be broken down by stage.
+    """
+    
+    def __init__(self, duration, filename, interval=0.005, getStage=None, nTop=25):
+        self.duration = duration
+        self.filename = filename
+        self.interval = interval
+        self.getStage = getStage
+        self.nTop = nTop
+        
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        
+    def start(self):
+        self._thread.start()
+        
+    def is_alive(self):
+        return self._thread.is_alive()
+        
+    def _run(self):
+        mainThread = threading.main_thread().ident
+        
+        nSamples = 0
+        leaf, inclusive, stacks, stages = {}, {}, {}, {}
+        tStop = time.time() + self.duration
+        while time.time() < tStop:
+            frame = sys._current_frames().get(mainThread, None)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append("%s (%s:%i)" % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+                
+            if len(names) > 0:
+                nSamples += 1
+                leaf[names[0]] = leaf.get(names[0], 0) + 1
+                for name in set(names):
+                    inclusive[name] = inclusive.get(name, 0) + 1
+                stack = ' <- '.join(names[:6])
+                stacks[stack] = stacks.get(stack, 0) + 1
+                if self.getStage is not None:
+                    stage = self.getStage()
+                    stages[stage] = stages.get(stage, 0) + 1
+            time.sleep(self.interval)
+            
+        self.write_report(nSamples, leaf, inclusive, stacks, stages)
+        
+    def write_report(self, nSamples, leaf, inclusive, stacks, stages):
+        def _top(counts):
+            lines = []
+            for name,count in sorted(counts.items(), key=lambda x: x[1], reverse=True)[:self.nTop]:
+                lines.append("  %6.1f%%  %s" % (100.0*count/max([nSamples, 1]), name))
+            return lines
+            
+        lines = ["Profile of %s (PID %i)" % (os.path.basename(sys.argv[0]), os.getpid()),
+                 "%i samples over %.0f s" % (nSamples, self.duration),
+                 "",
+                 "Stages:"]
+        lines.extend(_top(stages))
+        lines.extend(["", "Functions (self):"])
+        lines.extend(_top(leaf))
+        lines.extend(["", "Functions (inclusive):"])
+        lines.extend(_top(inclusive))
+        lines.extend(["", "Stacks (innermost first):"])
+        lines.extend(_top(stacks))
+        
+        try:
+            with open(self.filename, 'w') as fh:
+                fh.write('\n'.join(lines)+'\n')
+            print("Wrote profile to %s" % self.filename)
+        except (IOError, OSError) as e:
+            print("Error writing profile to %s: %s" % (self.filename, str(e)))
+
+
+class UIWatchdog(object):
+    """
+    Class to watch for stalls in the wx main loop.  The main loop calls beat()
+    from a timer and marks what it is doing with stage().  A background thread
+    prints the main thread's stack and the current stage whenever the heartbeat
+    is more than 'budget' seconds late.  The same thread also starts a
+    SamplingProfiler when requested via requestProfile() or when 'flagFile'
+    appears.
+    """
+    
+    def __init__(self, budget=0.0, flagFile=None, profileSeconds=30.0, profilePath=None, interval=0.25):
+        self.budget = budget
+        self.flagFile = flagFile
+        self.profileSeconds = profileSeconds
+        self.profilePath = profilePath if profilePath is not None else tempfile.gettempdir()
+        self.interval = interval
+        
+        self.mainThread = threading.main_thread().ident
+        self.heartbeat = time.time()
+        self.stages = []
+        self.stallStart = None
+        self.profiler = None
+        self.profileRequested = False
+        
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        
+    def start(self):
+        self.heartbeat = time.time()
+        self._thread.start()
+        
+    def stop(self):
+        self._stop.set()
+        
+    def beat(self, event=None):
+        self.heartbeat = time.time()
+        
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager to mark what the main thread is doing.
+        """
+        
+        self.stages.append(name)
+        try:
+            yield
+        finally:
+            self.stages.pop()
+            
+    def getStage(self):
+        stages = list(self.stages)
+        return ' > '.join(stages) if stages else 'idle'
+        
+    def requestProfile(self, signum=None, frame=None):
+        """
+        Ask for a profile, suitable for use as a signal handler.  The profile
+        is started from the watchdog thread.
+        """
+        
+        self.profileRequested = True
+        
+    def startProfile(self, duration=None):
+        if self.profiler is not None and self.profiler.is_alive():
+            return False
+            
+        if duration is None:
+            duration = self.profileSeconds
+        filename = os.path.join(self.profilePath, 'lwatv-profile-%s.txt' % time.strftime('%Y%m%d-%H%M%S'))
+        print("Profiling for %.0f s" % duration)
+        self.profiler = SamplingProfiler(duration, filename, getStage=self.getStage)
+        self.profiler.start()
+        return True
+        
+    def report(self, late):
+        frame = sys._current_frames().get(self.mainThread, None)
+        lines = ["UI stalled for %.1f s in stage '%s', main thread stack:" % (late, self.getStage())]
+        if frame is not None:
+            lines.extend([line.rstrip() for line in traceback.format_stack(frame)])
+        print('\n'.join(lines))
+        sys.stdout.flush()
+        
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Stalls
+            if self.budget > 0:
+                late = time.time() - self.heartbeat
+                if late > self.budget and self.stallStart is None:
+                    self.stallStart = self.heartbeat
+                    self.report(late)
+                elif late <= self.budget and self.stallStart is not None:
+                    print("UI recovered after a %.1f s stall" % (self.heartbeat - self.stallStart))
+                    self.stallStart = None
+                    
+            # Profile requests
+            duration = None
+            if self.flagFile is not None and os.path.exists(self.flagFile):
+                try:
+                    with open(self.flagFile, 'r') as fh:
+                        duration = float(fh.read().strip())
+                except (IOError, OSError, ValueError):
+                    pass
+                try:
+                    os.unlink(self.flagFile)
+                except OSError:
+                    pass
+                self.profileRequested = True
+            if self.profileRequested:
+                self.profileRequested = False
+                self.startProfile(duration)
+
+
+def staged(name):
+    """
+    Decorator for LWATV methods that marks them as stage 'name' for the
+    UIWatchdog.
+    """
+    
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwds):
+            with self.watchdog.stage(name):
+                return method(self, *args, **kwds)
+        return wrapper
+    return decorator
+
+
 LATEST_TIMER = 101
 MOVIE_TIMER = 102
+REPLAY_TIMER = 103
+METRICS_TIMER = 104
+WATCHDOG_TIMER = 105
 
 class LWATV(wx.Frame):
     def __init__(self, parent, title, args, config={}):
@@ -150,11 +2490,54 @@ class LWATV(wx.Frame):
         self.config = config
         self.config['imageMode'] = ''
         
-        # Paths
+        # Stall watchdog - this comes first so that the stages can be tracked
+        # from the start
         basePath = os.path.dirname(os.path.abspath(__file__))
+        self.watchdog = UIWatchdog(budget=self.args.watchdog_budget,
+                                   flagFile=os.path.join(basePath, 'profile.flag'),
+                                   profileSeconds=self.args.profile_seconds,
+                                   profilePath=self.args.profile_dir)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.watchdog.requestProfile)
+        self.watchdog.start()
+        
+        self.ledger = BandwidthLedger(os.path.join(basePath, 'movies', 'bandwidth.json'))
+        self.poller = PollScheduler(adaptive=self.args.adaptive_poll, ledger=self.ledger,
+                                    quota=self.args.quota_mb*1024**2)
+        self.changes = ChangeDetector()
+        
+        # Time-lapse buffer and movie recorder
+        self.lastModified = None
+        self.frameRing = None
+        self.replayIndex = None
+        if self.args.timelapse_mb > 0:
+            self.frameRing = FrameRing(self.args.timelapse_mb*1024**2, quantize=self.args.timelapse_quantize)
+        self.recorder = None
+        self.renderer = None
+        self.progressive = None
+        
+        # Render governor
+        self.baseFadeTime = self.config['fadeTime']
+        self.scaleQuality = wx.IMAGE_QUALITY_NORMAL
+        self.governor = None
+        if (self.args.frame_budget > 0 or self.args.cpu_budget > 0) \
+           and not self.args.split_fetcher and self.args.render_backend == 'wx':
+            self.governor = RenderGovernor(frameBudget=self.args.frame_budget/1000.0,
+                                           cpuBudget=self.args.cpu_budget/100.0)
+        self.painted = False
+        self.started = False
+        self.startupProfile = []
+        
+        # Paths
         self.infoPath = os.path.join(basePath, 'info')
         self.imagePath = os.path.join(basePath, 'images')
         self.moviePath = os.path.join(basePath, 'movies')
+        self.videoProbeFile = os.path.join(basePath, 'videoProbe.json')
+        self.videoProbe = None
+        
+        # Movie recorder, unless the fetcher process takes care of it
+        if self.args.record_movies and not self.args.split_fetcher:
+            self.recorder = MovieRecorder(self.moviePath, verbose=self.args.verbose)
         
         # Build the images
         self.initUI()
@@ -162,10 +2545,16 @@ class LWATV(wx.Frame):
         self.Show()
         if not self.args.disable_maximize:
             self.Maximize()
+        self.markStartup('window shown')
+        
+        # Start the fetcher process, if needed
+        self.frameBuffer = None
+        if self.args.split_fetcher:
+            self.initFetcher()
             
-        # Update
-        self.initImages()
-        self.updateTextSize()
+        # Update once the window has been painted for the first time, or after
+        # a second if that never seems to happen
+        wx.CallLater(1000, self.initImages)
         
     def initUI(self):	
         panel = wx.Panel(self, -1)
@@ -223,7 +2612,16 @@ class LWATV(wx.Frame):
             self.movieText.SetBackgroundColour(wx.BLACK)
             sizer.Add(self.movieText, (2+ih, iw//2), (1, iw//2), wx.ALIGN_CENTER|wx.ALIGN_CENTER_VERTICAL|wx.ALL, 4)
             ## Movie
-            self.previousMovie = MoviePlayer(panel, self.moviePath, self.movieText, self.args.verbose)
+            if self.args.timelapse_loop:
+                self.movieText.SetLabel("Time-Lapse")
+                self.previousMovie = TimeLapsePlayer(panel, self.frameRing, self.movieText, verbose=self.args.verbose)
+            else:
+                movieURL = None
+                if self.args.stream_newest:
+                    movieURL = lambda movie: getMovieURL(movie, self.args.lwatv2, self.args.base_url)
+                self.previousMovie = MoviePlayer(panel, self.moviePath, self.movieText, self.args.verbose,
+                                                 videoSink=self.args.video_sink, videoDecoder=self.args.video_decoder,
+                                                 isolate=self.args.isolate_movies, movieURL=movieURL)
             sizer.Add(self.previousMovie, (2+ih//2, iw//2), (ih//2, iw//2), iflags, 4)
             
         # Image Information
@@ -239,6 +2637,7 @@ class LWATV(wx.Frame):
             self.descriptionText.SetForegroundColour(wx.WHITE)
             self.descriptionText.SetBackgroundColour(wx.BLACK)
         sizer.Add(self.descriptionText, (1, iw), (ih, tw), wx.EXPAND|wx.ALL, 10)
+        self.textFitter = TextFitter(self.descriptionText)
         ## LWA1 Label
         lwa1Label = wx.StaticText(panel, label="Copyright (c) 2025 The LWA Consortium")
         lwa1Label.SetForegroundColour(wx.WHITE)
@@ -272,32 +2671,162 @@ class LWATV(wx.Frame):
         # Window manager close
         self.Bind(wx.EVT_CLOSE, self.onQuit)
         
+        # Keyboard shortcuts
+        self.Bind(wx.EVT_CHAR_HOOK, self.onKey)
+        
         # Timers
         ## Latest Image
         self.latestTimer = wx.Timer(self, LATEST_TIMER)
-        self.Bind(wx.EVT_TIMER, self.updateLatestImage)
+        self.Bind(wx.EVT_TIMER, self.updateLatestImage, id=LATEST_TIMER)
+        ## Time-lapse replay
+        self.replayTimer = wx.Timer(self, REPLAY_TIMER)
+        self.Bind(wx.EVT_TIMER, self.updateReplay, id=REPLAY_TIMER)
+        ## Metrics
+        self.metricsTimer = wx.Timer(self, METRICS_TIMER)
+        self.Bind(wx.EVT_TIMER, self.writeMetrics, id=METRICS_TIMER)
+        ## Watchdog heartbeat
+        self.watchdogTimer = wx.Timer(self, WATCHDOG_TIMER)
+        self.Bind(wx.EVT_TIMER, self.watchdog.beat, id=WATCHDOG_TIMER)
+        if self.args.watchdog_budget > 0:
+            self.watchdogTimer.Start(max([50, int(self.args.watchdog_budget*1000/4)]))
+            
+    def initFetcher(self):
+        # Size the frame buffer so that it can hold a full screen image
+        w, h = wx.GetDisplaySize()
+        self.frameBuffer = SharedFrameBuffer(w, h)
+        self.frameBufferSeq = 0
+        self.wxSharedImage = None
+        self.sharedDrawnSize = None
         
+        # Restarts back off exponentially, up to five minutes, while the
+        # fetcher keeps dying
+        self.fetcherFailures = 0
+        self.fetcherRestart = None
+        self.startFetcher()
+        
+    def startFetcher(self):
+        ctx = get_context('spawn')
+        self.fetcherStop = ctx.Event()
+        self.fetcher = ctx.Process(target=runFrameFetcher,
+                                   args=(self.frameBuffer.name,
+                                         self.frameBuffer.width, self.frameBuffer.height,
+                                         self.imagePath, self.args.lwatv2,
+                                         self.args.enable_fade, self.config['fadeTime'],
+                                         self.fetcherStop, self.args.verbose,
+                                         self.args.adaptive_poll,
+                                         self.moviePath if self.args.record_movies else None,
+                                         self.args.speculative_fetch,
+                                         self.ledger.filename, self.args.quota_mb*1024**2,
+                                         self.args.base_url),
+                                   daemon=True)
+        self.fetcher.start()
+        self.fetcherStarted = time.time()
+        if self.args.verbose:
+            print("Started fetcher process with PID %i" % self.fetcher.pid)
+            
+    def stopFetcher(self):
+        self.fetcherStop.set()
+        self.fetcher.join(2)
+        if self.fetcher.is_alive():
+            self.fetcher.terminate()
+            self.fetcher.join()
+            
+    def markStartup(self, stage):
+        if self.args.startup_profile:
+            self.startupProfile.append((stage, time.time()-_START_TIME))
+            
+    def reportStartup(self):
+        if self.args.startup_profile:
+            print("Startup profile:")
+            for stage,t in self.startupProfile:
+                print("  %-24s %7.3f s" % (stage, t))
+            self.startupProfile = []
+            
     def initImages(self):
-        # Update the images, movie, and text
-        self.updateLatestImage()
+        if self.started:
+            return
+        self.started = True
+        
+        # Fill in what we have locally first so that the window is not left
+        # empty while the latest image downloads
         self.updateStationImage()
+        self.markStartup('station image')
         self.updateImageDescription()
+        self.markStartup('description')
+        
+        # Start the download of the latest image
+        if self.args.render_backend == 'gstreamer':
+            self.renderer = CompositorRenderer(self.latestImage, self.config['fadeTime'],
+                                               verbose=self.args.verbose, videoSink=self.args.video_sink)
+        self.updateLatestImage()
         
         # Start the timers
-        if self.args.enable_fade:
+        if self.renderer is not None and self.args.enable_fade:
+            lift = 50
+        elif self.args.enable_fade or self.args.split_fetcher or self.args.progressive:
             lift = 200
+        elif self.args.adaptive_poll:
+            lift = 1000
         else:
             lift = 5000
         self.latestTimer.Start(lift)
+        if self.args.metrics_file is not None:
+            self.metricsTimer.Start(int(self.args.metrics_interval*1000))
+            
+        # Everything else can wait
+        wx.CallAfter(self.initDeferred)
+        
+    def initDeferred(self):
+        # Start the movie
         if not self.args.disable_movie:
             wx.CallAfter(self.updatePreviousMovie)
+        else:
+            self.reportStartup()
+            
+        # Probe for the best video sink and decoder now that the window is up
+        if self.args.probe_video and self.args.video_auto:
+            self.startVideoProbe()
+            
+    def startVideoProbe(self):
+        ctx = get_context('spawn')
+        self.videoProbe = ctx.Process(target=runVideoProbe, args=(self.videoProbeFile, self.args.verbose),
+                                      daemon=True)
+        self.videoProbe.start()
+        
+        def wait():
+            self.videoProbe.join()
+            wx.CallAfter(self.applyVideoProbe)
+        waiter = threading.Thread(target=wait)
+        waiter.daemon = True
+        waiter.start()
+        
+    def applyVideoProbe(self):
+        if not self:
+            # Already closed
+            return
+            
+        config = loadVideoConfig(self.videoProbeFile)
+        if config is None:
+            print("Video probe exited with code %s, staying with the GStreamer defaults" % self.videoProbe.exitcode)
+            return
+        for key in self.args.video_auto:
+            setattr(self.args, 'video_'+key, config[key])
+        if self.args.verbose:
+            print("Using video sink %s and decoder %s" % (self.args.video_sink, self.args.video_decoder))
+            
+        # The renderer keeps its sink until the next start but the movies can
+        # switch over with the next one
+        if not self.args.disable_movie and hasattr(self.previousMovie, 'set_video'):
+            self.previousMovie.set_video(self.args.video_sink, self.args.video_decoder)
             
     def onSize(self, event):
         self.panel.Layout()
         self.Layout()
         self.panel.Update()
         self.Update()
-        
+        if not self.started:
+            return
+            
         self.updateLatestImage()
         self.updateStationImage()
         self.updateTextSize()
@@ -305,82 +2834,214 @@ class LWATV(wx.Frame):
     def onPaint(self, event):
         self.panel.Update()
         self.Update()
-        
+        if not self.started:
+            # First paint - get the images going
+            if not self.painted:
+                self.painted = True
+                self.markStartup('first paint')
+                wx.CallAfter(self.initImages)
+            return
+            
+        # The shared frame needs to be drawn again after an expose
+        self.sharedDrawnSize = None
         self.updateLatestImage()
         self.updateStationImage()
         
+    def onKey(self, event):
+        if event.GetKeyCode() in (ord('R'), ord('r')) and self.frameRing is not None:
+            self.startReplay()
+        else:
+            event.Skip()
+            
     def onQuit(self, event):
         self.latestTimer.Stop()
+        self.replayTimer.Stop()
+        self.metricsTimer.Stop()
+        self.watchdogTimer.Stop()
+        self.watchdog.stop()
+        self.ledger.flush()
+        if self.recorder is not None:
+            self.recorder.finish(wait=True)
+        if self.renderer is not None:
+            self.renderer.stop()
+        if self.frameBuffer is not None:
+            self.stopFetcher()
+            self.frameBuffer.close()
         if not self.args.disable_movie:
             self.previousMovie.stop()
         self.Destroy()
         
-    def loadStationImage(self):
-        if self.args.lwatv2:
-            fh = open(os.path.join(self.imagePath, 'lwasv.jpg'), 'rb')
-        else:
-            fh = open(os.path.join(self.imagePath, 'lwa1.jpg'), 'rb')
-        data = fh.read()
-        fh.close()
+    def _outgrown(self, decodeSize, panel):
+        # Has the panel grown larger than the size we decoded an image for?
+        w, h = panel.GetSize()
+        return w > decodeSize[0] or h > decodeSize[1]
         
-        self.wxStationImage = Image(BytesIO(data))
+    def loadStationImage(self):
+        if getattr(self, "stationImageData", None) is None:
+            if self.args.lwatv2:
+                fh = open(os.path.join(self.imagePath, 'lwasv.jpg'), 'rb')
+            else:
+                fh = open(os.path.join(self.imagePath, 'lwa1.jpg'), 'rb')
+            self.stationImageData = fh.read()
+            fh.close()
+            
+        # Decode at about the size of the panel
+        self.stationDecodeSize = tuple(self.stationImage.GetSize())
+        pilImage = decodeForSize(self.stationImageData, self.stationDecodeSize)
+        self.wxStationImage = pilToWx(pilImage)
         
+    def setLatestLabel(self, mode):
+        if mode == 'Error':
+            self.latestText.SetLabel("Network Connection Error")
+            return
+            
+        self.config['imageMode'] = mode
+        if mode == 'Beams':
+            self.latestText.SetLabel("Current Beam Pointings")
+        elif self.args.lwatv2:
+            self.latestText.SetLabel("Latest LWATV2 Image")
+        else:
+            self.latestText.SetLabel("Latest LWATV Image")
+            
+    @staged('download')
     def loadLatestImage(self):
-        if self.args.lwatv2:
-            url = 'https://lwalab.phys.unm.edu/lwatv2/lwatv.png?lwatvgui=%s' % int(time.time())
-            urlAlt = 'https://lwalab.phys.unm.edu/lwatv2/beamPointings.png?lwatvgui=%s' % int(time.time())
+        first = getattr(self, "wxLatestImage", None) is None
+        if self.progressive is None and (self.args.progressive or first):
+            # Download in the background, showing the progress if asked to.
+            # The first image always comes this way so that a slow network
+            # does not hold up the rest of the window.
+            self.progressive = ProgressiveFetch(self.imagePath, self.args.lwatv2,
+                                                speculative=self.args.speculative_fetch,
+                                                baseURL=self.args.base_url,
+                                                onDone=lambda: wx.CallAfter(self.onLatestFetched))
+            self.progressiveShown = 0.0
+            return
+        if self.progressive is not None:
+            if not self.progressive.done():
+                if self.args.progressive:
+                    self.drawLatestProgress()
+                return
+            tPoll, latest = self.progressive.tPoll, self.progressive.result
+            self.progressive = None
+            
+            # Clear the progress bar
+            self.latestStale = True
         else:
-            url = 'https://lwalab.phys.unm.edu/lwatv/lwatv.png?lwatvgui=%s' % int(time.time())
-            urlAlt = 'https://lwalab.phys.unm.edu/lwatv/beamPointings.png?lwatvgui=%s' % int(time.time())
+            tPoll = time.time()
+            latest = fetchLatestImage(self.imagePath, self.args.lwatv2, speculative=self.args.speculative_fetch,
+                                      baseURL=self.args.base_url)
+        delay = self.poller.update(latest, tPoll)
+        self.setLatestLabel(latest.mode)
         
-        latestResult = "Download at %s" % url
-        try:
-            # Try to get the latest image...
-            fh = urlopen(url)
-            data = fh.read()
-            fh.close()
+        if self.args.verbose:
+            print(latest.status)
+            print("Next poll in %.1f s" % delay)
+            if self.args.quota_mb > 0:
+                print("Projected to use %.1f MB of the %.1f MB daily quota" % (self.ledger.project()/1024.0**2, self.args.quota_mb))
+                
+        # Nothing else to do if we have already seen this image
+        if self.changes.isSame(latest.data):
+            if self.args.verbose:
+                print("Image is unchanged")
+            return
             
-            info = fh.info()
-            lm = info.get("last-modified")
-            lm = datetime.strptime(lm, "%a, %d %b %Y %H:%M:%S GMT")
-            age = datetime.utcnow() - lm
-            age = age.days*24*3600 + age.seconds
+        self.useLatestImage(latest)
+        if first:
+            self.markStartup('first image')
             
-            # Is the image recent enough to think that TBN/PASI is running?
-            if age > 120:
-                fh = urlopen(urlAlt)
-                data = fh.read()
-                fh.close()
-                
-                latestResult = latestResult+" -> LASI is not currently running"
-                
-                self.config['imageMode'] = 'Beams'
-                self.latestText.SetLabel("Current Beam Pointings")
-            else:
-                self.config['imageMode'] = 'LWATV'
-                if self.args.lwatv2:
-                    self.latestText.SetLabel("Latest LWATV2 Image")
+    def onLatestFetched(self):
+        if not self:
+            # Already closed
+            return
+            
+        # Show the new image without waiting for the next timer tick
+        self.updateLatestImage()
+        
+    @staged('decode')
+    def useLatestImage(self, latest):
+        # Decode at about the size of the panel
+        self.latestData = latest.data
+        self.latestDecodeSize = tuple(self.latestImage.GetSize())
+        pilImage = decodeForSize(latest.data, self.latestDecodeSize)
+        self.wxLatestImage = pilToWx(pilImage)
+        self.latestStale = True
+        
+        # Save new LWATV frames for the time-lapse and the recorder
+        if latest.mode == 'LWATV' and latest.lastModified != self.lastModified:
+            self.lastModified = latest.lastModified
+            t = calendar.timegm(latest.lastModified.timetuple())
+            if self.frameRing is not None:
+                if self.args.timelapse_loop:
+                    size = self.previousMovie.GetSize()
                 else:
-                    self.latestText.SetLabel("Latest LWATV Image")
+                    size = self.latestImage.GetSize()
+                try:
+                    self.frameRing.add(pilImage, size, t)
+                except ValueError as e:
+                    # The budget cannot hold two frames at the panel size
+                    print("WARNING: %s, disabling the time-lapse" % str(e))
+                    self.frameRing = None
+            if self.recorder is not None:
+                # Movies are recorded at full resolution so leave the
+                # decoding to the recorder
+                try:
+                    self.recorder.addFrame(latest.data, t)
+                except Exception as e:
+                    print("WARNING: %s, disabling movie recording" % str(e))
+                    self.recorder = None
                 
-        except:
-            # Deal with network/download errors
-            fh = open(os.path.join(self.imagePath, 'error.png'), 'r')
-            data = fh.read()
-            fh.close()
+        # Hand the new image off to GStreamer
+        if self.renderer is not None:
+            nearlySame = self.changes.isNearlySame(pilImage)
+            self.renderer.show(pilImage, fade=self.args.enable_fade and not nearlySame)
+            return
             
-            latestResult = latestResult+" -> error"
-            self.latestText.SetLabel("Network Connection Error")
+        if self.args.enable_fade:
+            pilImageOld = getattr(self, "pilLatestImage", None)
+            nearlySame = self.changes.isNearlySame(pilImage)
+            if pilImageOld is None or nearlySame:
+                # Not worth fading
+                self.pilLatestImageOld = pilImage
+                self.pilLatestImageTime = time.time() - self.config['fadeTime']
+                self.latestRegion = None
+            else:
+                # Fade, only redrawing the part that changed if the last fade
+                # has finished
+                if time.time()-self.pilLatestImageTime >= self.config['fadeTime'] \
+                   and pilImageOld.size == pilImage.size:
+                    self.latestRegion = changedRegion(pilImageOld, pilImage)
+                else:
+                    self.latestRegion = None
+                self.pilLatestImageOld = pilImageOld
+                self.pilLatestImageTime = time.time()
+            self.pilLatestImage = pilImage
+        else:
+            # Only redraw the part that changed, or nothing at all if the
+            # change is too small to notice.  A progressive download has drawn
+            # over the panel so that always needs a full redraw.
+            pilImageOld = getattr(self, "pilLatestImage", None)
+            nearlySame = self.changes.isNearlySame(pilImage)
+            self.latestRegion = None
+            if pilImageOld is not None and not self.args.progressive:
+                if nearlySame:
+                    self.latestStale = False
+                    return
+                if pilImageOld.size == pilImage.size:
+                    self.latestRegion = changedRegion(pilImageOld, pilImage)
+            self.pilLatestImage = pilImage
             
-        if self.args.verbose:
-            print(latestResult)
-        self.wxLatestImage = Image(BytesIO(data))
+    @staged('decode')
+    def decodeLatestImage(self):
+        # Decode the current image again for a larger panel
+        self.latestDecodeSize = tuple(self.latestImage.GetSize())
+        pilImage = decodeForSize(self.latestData, self.latestDecodeSize)
+        self.wxLatestImage = pilToWx(pilImage)
+        self.latestStale = True
         
-        if self.args.enable_fade:
-            self.pilLatestImageTime = time.time()
-            self.pilLatestImage = PImage.open(BytesIO(data))
-            self.pilLatestImage = self.pilLatestImage.convert('RGB')
+        self.pilLatestImage = self.pilLatestImageOld = pilImage
+        self.latestRegion = None
             
+    @staged('description')
     def loadImageDescription(self):
         if self.args.lwatv2:
             fh = open(os.path.join(self.infoPath, 'lwatv2.txt'))
@@ -405,12 +3066,14 @@ class LWATV(wx.Frame):
         s = min([wr, hr])
         return int(round(wi*s)), int(round(hi*s))
         
+    @staged('station image')
     def updateStationImage(self, event=None):
-        if getattr(self, "wxStationImage", None) is None:
+        if getattr(self, "wxStationImage", None) is None \
+           or self._outgrown(self.stationDecodeSize, self.stationImage):
             self.loadStationImage()
             
         w, h = self._keepAspect(self.wxStationImage, self.stationImage)
-        image = self.wxStationImage.Scale(w, h, wx.IMAGE_QUALITY_NORMAL)
+        image = self.wxStationImage.Scale(w, h, self.scaleQuality)
         w2, h2 = self.stationImage.GetSize()
         image.Resize(self.stationImage.GetSize(), ((w2-w)//2, (h2-h)//2), 0, 0, 0)
         bitmap = Bitmap(image)
@@ -419,23 +3082,63 @@ class LWATV(wx.Frame):
         dc.DrawBitmap(bitmap, 0, 0)
         
     def updateLatestImage(self, event=None, fade=False):
+        if self.frameBuffer is not None:
+            self.updateSharedImage()
+            return
+            
         oldMode = self.config['imageMode']
         
-        if getattr(self, "wxLatestImage", None) is None:
-            self.latestImageTime = time.time()
-            self.loadLatestImage()
-            if self.args.enable_fade:
-                self.pilLatestImageOld = self.pilLatestImage
-                
-        if time.time() - self.latestImageTime > 5:
-            self.latestImageTime = time.time()
-            if self.args.enable_fade:
-                self.pilLatestImageOld = self.pilLatestImage
+        if getattr(self, "wxLatestImage", None) is None or self.poller.due():
             self.loadLatestImage()
+        elif self.renderer is None and self._outgrown(self.latestDecodeSize, self.latestImage):
+            self.decodeLatestImage()
+            
+        # Still waiting on the first image
+        if getattr(self, "wxLatestImage", None) is None:
+            return
+            
+        if oldMode != self.config['imageMode']:
+            if self.args.verbose:
+                print("Image mode changed, triggering description update")
+            wx.CallAfter(self.updateImageDescription)
+            
+        # Leave the panel alone while a time-lapse replay is running
+        if self.replayIndex is not None:
+            self.latestStale = True
+            return
             
+        # GStreamer does the drawing, we just need to keep it up to date
+        if self.renderer is not None:
+            self.renderer.tick()
+            if event is None:
+                self.renderer.expose()
+            return
+            
+        # Keep the drawing within budget
+        if self.governor is not None and event is not None:
+            self.updateGovernor()
+            
+        # Timer ticks with nothing new to show do not need a redraw
+        fading = self.args.enable_fade \
+                 and time.time()-self.pilLatestImageTime < self.config['fadeTime']
+        if event is not None and not fading and not self.latestStale:
+            return
+        self.latestStale = fading
+        
+        tRender = time.perf_counter()
+        self.drawLatestImage(event, fading)
+        if self.governor is not None:
+            self.governor.record(time.perf_counter() - tRender)
+            
+    @staged('scale')
+    def drawLatestImage(self, event, fading):
         if self.args.enable_fade:
-            if time.time()-self.pilLatestImageTime < self.config['fadeTime']:
+            if fading:
                 alpha = (time.time() - self.pilLatestImageTime)/self.config['fadeTime']
+                if event is not None and self.latestRegion is not None:
+                    self.drawLatestRegion(alpha)
+                    return
+                    
                 try:
                     pilImage = PImage.blend(self.pilLatestImageOld, self.pilLatestImage, alpha)
                     pilImage = pilImage.convert('RGB')
@@ -445,13 +3148,19 @@ class LWATV(wx.Frame):
                 pilImage = self.pilLatestImage
                 
             # Convert to wxImage
-            wxImage = wx.EmptyImage( *pilImage.size  )
+            wxImage = EmptyImage( *pilImage.size  )
             wxImage.SetData(pilImage.tobytes())
         else:
+            if event is not None and self.latestRegion is not None:
+                # Only needs drawing once
+                self.drawLatestRegion(1.0)
+                self.latestRegion = None
+                return
+                
             wxImage = self.wxLatestImage
             
         w, h = self._keepAspect(wxImage, self.latestImage)
-        image = wxImage.Scale(w, h, wx.IMAGE_QUALITY_NORMAL)
+        image = wxImage.Scale(w, h, self.scaleQuality)
         w2, h2 = self.latestImage.GetSize()
         image.Resize(self.latestImage.GetSize(), ((w2-w)//2, (h2-h)//2), 0, 0, 0)
         bitmap = Bitmap(image)
@@ -459,39 +3168,217 @@ class LWATV(wx.Frame):
         dc = ClientDC(self.latestImage)
         dc.DrawBitmap(bitmap, 0, 0)
         
+    @staged('scale')
+    def drawLatestProgress(self):
+        data, fraction, ready = self.progressive.getProgress()
+        if fraction is None or self.replayIndex is not None:
+            return
+            
+        dc = ClientDC(self.latestImage)
+        wd, hd = self.latestImage.GetSize()
+        
+        # Once enough has arrived, draw the rows that are in over the old
+        # image.  PNG rows only arrive roughly in proportion to the data so
+        # hold back to stay clear of the undecoded (black) part.
+        if ready and fraction >= 0.25 and fraction - self.progressiveShown >= 0.1:
+            pilImage = decodePartial(data, (wd, hd))
+            if pilImage is not None:
+                self.progressiveShown = fraction
+                wi, hi = pilImage.size
+                rows = int(hi*0.8*fraction)
+                s = min([1.0*wd/wi, 1.0*hd/hi])
+                w, h = int(round(wi*s)), int(round(rows*s))
+                if rows > 0 and w > 0 and h > 0:
+                    image = pilToWx(pilImage.crop((0, 0, wi, rows))).Scale(w, h, self.scaleQuality)
+                    dc.DrawBitmap(Bitmap(image), (wd-w)//2, (hd-int(round(hi*s)))//2)
+                    
+        # Progress bar along the bottom of the panel
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.SetBrush(wx.Brush(wx.Colour(0, 160, 255)))
+        dc.DrawRectangle(0, hd-4, int(wd*min([fraction, 1.0])), 4)
+        
+    @staged('scale')
+    def drawLatestRegion(self, alpha):
+        # Blend just the part of the image that changed
+        x0, y0, x1, y1 = self.latestRegion
+        if alpha >= 1.0:
+            pilImage = self.pilLatestImage.crop(self.latestRegion)
+        else:
+            pilImage = PImage.blend(self.pilLatestImageOld.crop(self.latestRegion),
+                                    self.pilLatestImage.crop(self.latestRegion), alpha)
+                                
+        # Figure out where it goes in the panel
+        wi, hi = self.pilLatestImage.size
+        wd, hd = self.latestImage.GetSize()
+        s = min([1.0*wd/wi, 1.0*hd/hi])
+        xo, yo = (wd - int(round(wi*s)))//2, (hd - int(round(hi*s)))//2
+        xs, ys = int(round(x0*s)), int(round(y0*s))
+        w, h = int(round(x1*s)) - xs, int(round(y1*s)) - ys
+        if w <= 0 or h <= 0:
+            return
+            
+        image = pilToWx(pilImage).Scale(w, h, self.scaleQuality)
+        bitmap = Bitmap(image)
+        
+        dc = ClientDC(self.latestImage)
+        dc.DrawBitmap(bitmap, xo+xs, yo+ys)
+        
+    def getMetrics(self):
+        metrics = {'time': time.time(),
+                   'imageMode': self.config['imageMode']}
+        if self.governor is not None:
+            metrics['governor'] = {'level': self.governor.level,
+                                   'renderTime': self.governor.renderTime,
+                                   'cpu': self.governor.cpu}
+        if not self.args.disable_movie and hasattr(self.previousMovie, 'get_stats'):
+            metrics['movies'] = self.previousMovie.get_stats()
+        metrics['bandwidth'] = {'today': self.ledger.get_day(),
+                                'projected': self.ledger.project(),
+                                'quota': self.args.quota_mb*1024**2 if self.args.quota_mb > 0 else None,
+                                'pollFloor': self.poller.floor}
+        return metrics
+        
+    @staged('metrics')
+    def writeMetrics(self, event=None):
+        # Write to a temporary file first so that readers never see a
+        # partial file
+        filename = self.args.metrics_file
+        try:
+            with open(filename+'.tmp', 'w') as fh:
+                json.dump(self.getMetrics(), fh, indent=2)
+            os.replace(filename+'.tmp', filename)
+        except (IOError, OSError) as e:
+            print("Error writing metrics to %s: %s" % (filename, str(e)))
+            
+    def updateGovernor(self):
+        if not self.governor.evaluate():
+            return
+            
+        interval, fadeFraction, quality = self.governor.getSettings()
+        self.config['fadeTime'] = self.baseFadeTime*fadeFraction
+        self.scaleQuality = quality
+        if self.args.enable_fade:
+            self.latestTimer.Start(interval)
+        if self.args.verbose:
+            print("Render governor at level %i: %i ms ticks, %.2f s fades (render %.1f ms, CPU %.0f%%)" % (self.governor.level, interval, self.config['fadeTime'], 1000*self.governor.renderTime, 100*self.governor.cpu))
+            
+    def startReplay(self):
+        if self.replayIndex is not None or len(self.frameRing) == 0:
+            return
+            
+        if self.args.verbose:
+            print("Replaying %i time-lapse frames" % len(self.frameRing))
+        self.replayIndex = 0
+        self.latestText.SetLabel("Time-Lapse of the Last %i Minutes" % round(self.frameRing.getSpan()/60.0))
+        self.replayTimer.Start(100)
+        
+    @staged('replay')
+    def updateReplay(self, event=None):
+        if self.replayIndex >= len(self.frameRing):
+            # Done, back to the latest image
+            self.replayTimer.Stop()
+            self.replayIndex = None
+            self.setLatestLabel(self.config['imageMode'])
+            if self.renderer is not None:
+                self.renderer.redraw()
+            self.updateLatestImage()
+            return
+            
+        if self.renderer is not None:
+            self.renderer.show(self.frameRing.get(self.replayIndex), remember=False)
+        else:
+            drawFitted(pilToWx(self.frameRing.get(self.replayIndex)), self.latestImage)
+        self.replayIndex += 1
+        
+    @staged('shared frame')
+    def updateSharedImage(self):
+        oldMode = self.config['imageMode']
+        
+        # Restart the fetcher if it has died
+        if not self.fetcher.is_alive():
+            if self.fetcherRestart is None:
+                if time.time() - self.fetcherStarted > 300:
+                    # It had been running fine for a while
+                    self.fetcherFailures = 0
+                self.fetcherFailures += 1
+                delay = min([2**(self.fetcherFailures-1), 300])
+                print("Fetcher process exited with code %s, restarting in %i s" % (self.fetcher.exitcode, delay))
+                self.fetcherRestart = time.time() + delay
+            elif time.time() >= self.fetcherRestart:
+                self.fetcherRestart = None
+                self.startFetcher()
+                
+        # Let the fetcher know what size we need and pick up any new frame
+        w2, h2 = self.latestImage.GetSize()
+        self.frameBuffer.setPanelSize(w2, h2)
+        frame = self.frameBuffer.read(after=self.frameBufferSeq)
+        if frame is not None:
+            self.frameBufferSeq, mode, w, h, data = frame
+            self.setLatestLabel(mode)
+            
+            self.wxSharedImage = EmptyImage(w, h)
+            self.wxSharedImage.SetData(data)
+            
+        if self.wxSharedImage is None:
+            return
+            
+        # Nothing to do if the panel already shows this frame at this size
+        if frame is None and (w2, h2) == self.sharedDrawnSize:
+            return
+            
+        # Frames should already be the right size but the panel may have been
+        # resized since the fetcher last wrote one
+        image = self.wxSharedImage
+        if image.GetSize() != (w2, h2):
+            w, h = self._keepAspect(image, self.latestImage)
+            image = image.Scale(w, h, self.scaleQuality)
+            image.Resize(self.latestImage.GetSize(), ((w2-w)//2, (h2-h)//2), 0, 0, 0)
+        bitmap = Bitmap(image)
+        
+        dc = ClientDC(self.latestImage)
+        dc.DrawBitmap(bitmap, 0, 0)
+        self.sharedDrawnSize = (w2, h2)
+        
         if oldMode != self.config['imageMode']:
             if self.args.verbose:
                 print("Image mode changed, triggering description update")
             wx.CallAfter(self.updateImageDescription)
             
+    @staged('movie')
     def updatePreviousMovie(self, event=None):
         self.previousMovie.update()
+        if self.startupProfile:
+            self.markStartup('movie started')
+            self.reportStartup()
         
     def updateImageDescription(self, event=None):
         if getattr(self, "imageDescriptionLWATV", None) is None:
             self.loadImageDescription()
             
         if self.config['imageMode'] == 'LWATV':
-            self.descriptionText.SetValue(self.imageDescriptionLWATV)
+            text = self.imageDescriptionLWATV
         else:
-            self.descriptionText.SetValue(self.imageDescriptionBeams)
+            text = self.imageDescriptionBeams
+        if text != self.descriptionText.GetValue():
+            self.descriptionText.SetValue(text)
         wx.CallAfter(self.updateTextSize)
         
+    @staged('updateTextSize')
     def updateTextSize(self):
-        # Get the area of the text box
+        # Get the size of the text box
         w,h = self.descriptionText.GetSize()
-        ta = w*h
-        
+        if w <= 0 or h <= 0:
+            return
+            
         # Get the base font
         font = wx.SystemSettings.GetFont(wx.SYS_SYSTEM_FONT)
         
-        # Find the "right" font size to use and use it
-        def area2points(area, text):
-            points = math.sqrt(area/(1.5*len(text)))
-            points = math.floor(points)
-            return int(points)
-        font.SetPointSize( area2points(ta, self.descriptionText.GetValue()) )
-        self.descriptionText.SetFont(font)
+        # Find the largest font size that fits and only change the font if we
+        # really need to
+        points = self.textFitter.fit(self.descriptionText.GetValue(), (w,h), font)
+        if points != self.descriptionText.GetFont().GetPointSize():
+            font.SetPointSize(points)
+            self.descriptionText.SetFont(font)
 
 
 if __name__ == "__main__":
@@ -508,18 +3395,114 @@ if __name__ == "__main__":
                         help='dislay GUI status messages')
     parser.add_argument('-2', '--lwatv2', action='store_true',
                         help='show data from LWA-SV instead of LWA1')
+    parser.add_argument('--base-url', type=str, default=LWALAB_URL,
+                        help='server to get the latest images from')
+    parser.add_argument('-s', '--split-fetcher', action='store_true',
+                        help='download, decode, and fade the latest image in a separate process')
+    parser.add_argument('-a', '--adaptive-poll', action='store_true',
+                        help='poll for new images based on how often they are updated')
+    parser.add_argument('--speculative-fetch', action='store_true',
+                        help='request the beam pointings at the same time as the latest image in case LASI is not running')
+    parser.add_argument('--quota-mb', type=float, default=DEFAULT_QUOTA_MB,
+                        help=QUOTA_HELP+'; polls are spread out to stay within it')
+    parser.add_argument('--progressive', action='store_true',
+                        help='download the latest image in the background and show it as it arrives; useful on slow links')
+    parser.add_argument('--timelapse-mb', type=float, default=0,
+                        help='memory budget in MB for keeping recent LWATV frames for time-lapse replays; press "r" to replay them')
+    parser.add_argument('--timelapse-quantize', action='store_true',
+                        help='store time-lapse frames with a 256 color palette to fit more into the budget')
+    parser.add_argument('--timelapse-loop', action='store_true',
+                        help='loop the time-lapse in the movie panel instead of playing old movies')
+    parser.add_argument('--render-backend', type=str, default='wx', choices=['wx', 'gstreamer'],
+                        help='how to scale, fade, and draw the latest image')
+    parser.add_argument('--frame-budget', type=float, default=0,
+                        help='time budget in ms for drawing a frame of the latest image; the fade rate, fade time, and scaling quality are adjusted to stay within it')
+    parser.add_argument('--cpu-budget', type=float, default=0,
+                        help='CPU budget in percent for the whole application; the fade rate, fade time, and scaling quality are adjusted to stay within it')
+    parser.add_argument('--record-movies', action='store_true',
+                        help='record new LWATV images into daily movies so that they do not need to be downloaded')
+    parser.add_argument('--metrics-file', type=str,
+                        help='periodically write status and playback metrics to this JSON file')
+    parser.add_argument('--metrics-interval', type=float, default=30.0,
+                        help='interval in seconds between metrics file updates')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='report how long the various startup stages take')
+    parser.add_argument('--watchdog-budget', type=float, default=0,
+                        help='report the stage and stack of the GUI when it does not respond for this many seconds; 0 disables')
+    parser.add_argument('--profile-seconds', type=float, default=30.0,
+                        help='how long to profile for when SIGUSR1 is received or a profile.flag file appears next to this script')
+    parser.add_argument('--profile-dir', type=str, default=tempfile.gettempdir(),
+                        help='directory to write profile reports to')
+    parser.add_argument('--isolate-movies', action='store_true',
+                        help='play the old movies in a separate process that is restarted if it fails so that they stay smooth when the GUI is busy')
+    parser.add_argument('--stream-newest', action='store_true',
+                        help='stream the newest movie from lwalab while updateMovies.py is still downloading it')
+    parser.add_argument('--video-sink', type=str,
+                        help='GStreamer video sink to use, "auto" to let GStreamer pick; the default is to probe for the fastest one')
+    parser.add_argument('--video-decoder', type=str,
+                        help='GStreamer H.264 decoder to use, "auto" to let GStreamer pick; the default is to probe for the fastest one')
+    parser.add_argument('--probe-video', action='store_true',
+                        help='probe for the fastest video sink and decoder again, in the background, instead of using the cached results')
     args = parser.parse_args()
-    
+    if args.timelapse_mb > 0 and numpy is None:
+        parser.error("--timelapse-mb requires numpy")
+    if args.render_backend != 'wx' and args.split_fetcher:
+        parser.error("--render-backend=%s is not supported with --split-fetcher" % args.render_backend)
+    if args.progressive and (args.split_fetcher or args.render_backend != 'wx'):
+        parser.error("--progressive requires --render-backend=wx and cannot be used with --split-fetcher")
+    if args.timelapse_mb > 0 and args.split_fetcher:
+        parser.error("--timelapse-mb is not supported with --split-fetcher")
+    if args.timelapse_loop and args.timelapse_mb <= 0:
+        parser.error("--timelapse-loop requires --timelapse-mb")
+    if args.timelapse_loop and args.disable_movie:
+        parser.error("--timelapse-loop cannot be used with --disable-movie")
+    if args.record_movies and findMovieEncoder() is None:
+        parser.error("--record-movies requires GStreamer with one of the %s encoders" % ', '.join(MOVIE_ENCODERS))
+    if args.isolate_movies and (args.disable_movie or args.timelapse_loop):
+        parser.error("--isolate-movies cannot be used with --disable-movie or --timelapse-loop")
+    if args.stream_newest and (args.disable_movie or args.timelapse_loop):
+        parser.error("--stream-newest cannot be used with --disable-movie or --timelapse-loop")
+    if args.stream_newest and args.quota_mb > 0:
+        parser.error("--stream-newest cannot be used with --quota-mb since it downloads the movie a second time")
+        
     # Check for movies
-    basePath = os.path.dirname(os.path.abspath(__file__))
-    moviePath = os.path.join(basePath, 'movies')
-    movies = glob.glob(os.path.join(moviePath, '*.mov'))
-    if len(movies) == 0:
-        print("WARNING: No movies found under 'movies/', disabling movie panel.")
-        print("         To enable the movie panel, run 'updateMovies.py' and   ")
-        print("         restart this script.                                   ")
-        args.disable_movies = True
+    if not args.disable_movie and not args.timelapse_loop:
+        basePath = os.path.dirname(os.path.abspath(__file__))
+        moviePath = os.path.join(basePath, 'movies')
+        movies = glob.glob(os.path.join(moviePath, '*.mov'))
+        if len(movies) == 0 and args.stream_newest:
+            # Keep the panel, with its placeholder, so that the first movie
+            # can be streamed while updateMovies.py downloads it
+            print("WARNING: No movies found under 'movies/', waiting for 'updateMovies.py'.")
+        elif len(movies) == 0:
+            print("WARNING: No movies found under 'movies/', disabling movie panel.")
+            print("         To enable the movie panel, run 'updateMovies.py' and   ")
+            print("         restart this script.                                   ")
+            args.disable_movie = True
+            
+    # GStreamer shares the X connection with wx when playing movies or
+    # rendering the latest image
+    args.video_auto = []
+    if (not args.disable_movie and not args.timelapse_loop) or args.render_backend == 'gstreamer':
+        initX11Threads()
         
+        # Pick the video sink and decoder.  If they have not been probed for
+        # yet let GStreamer pick for now; the probe runs in the background once
+        # the window is up.
+        args.video_auto = [key for key in ('sink', 'decoder') if getattr(args, 'video_'+key) is None]
+        if args.video_auto:
+            basePath = os.path.dirname(os.path.abspath(__file__))
+            videoConfig = None
+            if not args.probe_video:
+                videoConfig = loadVideoConfig(os.path.join(basePath, 'videoProbe.json'))
+            if videoConfig is None:
+                args.probe_video = True
+                videoConfig = {'sink': 'auto', 'decoder': 'auto'}
+            elif args.verbose:
+                print("Using video sink %s and decoder %s" % (videoConfig['sink'], videoConfig['decoder']))
+            for key in args.video_auto:
+                setattr(args, 'video_'+key, videoConfig[key])
+                
     print("Starting %s with PID %i" % (os.path.basename(__file__), os.getpid()))
     
     # Suppress various error popups